@@ -15,11 +15,14 @@ class Analytics:
         self.message_activity = message_activity
         self.shutdowns = shutdowns
         self.shutdowns.append(int(time.time()) << 1 | 0x1)
+        # Whether anything has been recorded since the data was last saved
+        self.dirty = True
 
     def command(self, cmd: str, args: str, user: pyryver.User, chat: pyryver.Chat) -> None: # pylint: disable=unused-argument
         """
         Record a command.
         """
+        self.dirty = True
         if cmd not in self.command_usage:
             self.command_usage[cmd] = {}
         if user.get_id() in self.command_usage[cmd]:
@@ -32,6 +35,7 @@ class Analytics:
         Record a message.
         """
         if len(body) < 750:
+            self.dirty = True
             if user.get_id() in self.message_activity:
                 self.message_activity[user.get_id()] += len(body)
             else:
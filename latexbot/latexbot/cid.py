@@ -29,6 +29,9 @@ class CaseInsensitiveKey:
 class CaseInsensitiveDict(dict):
     """
     A simple case-insensitive dictionary that keeps the original case of the key.
+
+    Since items() yields the original string keys, this dict can be passed to the json
+    module directly without making a copy with to_dict() first.
     """
     def __init__(self, d: typing.Dict[str, typing.Any] = None):
         super().__init__()
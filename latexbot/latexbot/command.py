@@ -49,6 +49,21 @@ class Command:
 
         The chat is used to determine whether the user is a forum or team admin.
         If the chat is not a pyryver.GroupChat, it will be ignored.
+
+        Results are cached for the duration of the message being processed, since a single
+        command may check authorization multiple times (e.g. for sub-commands).
+        """
+        cache = latexbot.bot.access_level_cache
+        key = (chat.get_id(), user.get_id())
+        level = cache.get(key)
+        if level is None:
+            level = cache[key] = await cls._get_access_level(chat, user)
+        return level
+
+    @classmethod
+    async def _get_access_level(cls, chat: pyryver.Chat, user: pyryver.User) -> int:
+        """
+        Get the access level of a user in a particular chat, without caching.
         """
         if user.get_id() == cls.MAINTAINER_ID:
             return cls.ACCESS_LEVEL_MAINTAINER
@@ -217,10 +232,14 @@ class CommandSet:
         return help_text, extended_help_text
 
 
+@functools.lru_cache(maxsize=None)
 def parse_doc(doc: str) -> typing.Dict[str, typing.Any]:
     """
     Parse command documentation into a dictionary.
 
+    Results are cached, since the docs never change at runtime. The returned dict
+    should not be modified.
+
     Format:
 
     <Short Description>
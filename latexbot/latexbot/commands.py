@@ -2,11 +2,12 @@
 This module contains command definitions for LaTeX Bot.
 """
 import aiohttp
+import ast
 import asyncio
-import io
+import concurrent.futures.process
+import hashlib
 import itertools
 import json
-import lark
 import logging
 import pyryver
 import random
@@ -30,6 +31,30 @@ from .tips import generate_random_tip
 logger = logging.getLogger("latexbot")
 
 
+# URLs of uploaded renders, keyed by a hash of the render arguments
+_RENDER_CACHE = {} # type: typing.Dict[bytes, str]
+_RENDER_CACHE_SIZE = 512
+
+
+async def _render_and_upload(ryver: pyryver.Ryver, filename: str, eqn: str, **kwargs) -> str:
+    """
+    Render LaTeX, upload the image, and return its URL.
+
+    If the same LaTeX was already rendered with the same options, the existing upload is reused.
+    Raises ValueError if the rendering failed.
+    """
+    key = hashlib.blake2b(repr((eqn, sorted(kwargs.items()))).encode("utf-8"), digest_size=16).digest()
+    url = _RENDER_CACHE.get(key)
+    if url is None:
+        img_data = await render.render(eqn, **kwargs)
+        url = (await ryver.upload_file(filename, img_data, "image/png")).get_file().get_url()
+        if len(_RENDER_CACHE) >= _RENDER_CACHE_SIZE:
+            # Evict the oldest entry
+            del _RENDER_CACHE[next(iter(_RENDER_CACHE))]
+        _RENDER_CACHE[key] = url
+    return url
+
+
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
 async def command_render(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -46,11 +71,10 @@ async def command_render(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
     """
     if args:
         try:
-            img_data = await render.render(args, color="gray", transparent=True)
+            url = await _render_and_upload(chat.get_ryver(), "formula.png", args, color="gray", transparent=True)
         except ValueError as e:
             raise CommandError(f"Formula rendering error:\n```\n{e}\n```") from e
-        file = (await chat.get_ryver().upload_file("formula.png", img_data, "image/png")).get_file()
-        await chat.send_message(f"Formula: `{args}`\n![{args}]({file.get_url()})", bot.msg_creator)
+        await chat.send_message(f"Formula: `{args}`\n![{args}]({url})", bot.msg_creator)
     else:
         await chat.send_message("Formula can't be empty.", bot.msg_creator)
 
@@ -69,15 +93,18 @@ async def command_chem(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
     """
     if args:
         try:
-            img_data = await render.render(f"\\ce{{{args}}}", color="gray", transparent=True, extra_packages=["mhchem"])
+            url = await _render_and_upload(chat.get_ryver(), "formula.png", f"\\ce{{{args}}}", color="gray", transparent=True, extra_packages=["mhchem"])
         except ValueError as e:
             raise CommandError(f"Formula rendering error:\n```\n{e}\n```\nDid you forget to put spaces on both sides of the reaction arrow?") from e
-        file = (await chat.get_ryver().upload_file("formula.png", img_data, "image/png")).get_file()
-        await chat.send_message(f"Formula: `{args}`\n![{args}]({file.get_url()})", bot.msg_creator)
+        await chat.send_message(f"Formula: `{args}`\n![{args}]({url})", bot.msg_creator)
     else:
         await chat.send_message("Formula can't be empty.", bot.msg_creator)
 
 
+# How many simple expression conversions are kept
+_SIMPLE_LATEX_CACHE_SIZE = 256
+
+
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
 async def command_render_simple(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     r"""
@@ -151,16 +178,24 @@ async def command_render_simple(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
     > `@latexbot renderSimple $\mathcal{L}${f(t)} = F(s) = int_0^inf f(t)e^(-st) dt`
     """
     try:
-        latex = await asyncio.wait_for(asyncio.get_event_loop().run_in_executor(None,
-            lambda: simplelatex.str_to_latex(args)), 20.0)
+        # Results are cached here, since every parse is done in a new worker process
+        latex = bot.simple_latex_cache.pop(args, None)
+        if latex is None:
+            # Parsing is CPU-bound, so do it in another process to avoid holding the GIL
+            latex = await bot.run_in_worker(simplelatex.str_to_latex_picklable, args, timeout=20.0)
+            if len(bot.simple_latex_cache) >= _SIMPLE_LATEX_CACHE_SIZE:
+                # Evict the least recently used entry
+                del bot.simple_latex_cache[next(iter(bot.simple_latex_cache))]
+        bot.simple_latex_cache[args] = latex
         try:
-            img_data = await render.render(latex, color="gray", transparent=True)
+            url = await _render_and_upload(chat.get_ryver(), "expression.png", latex, color="gray", transparent=True)
         except ValueError as e:
             raise CommandError(f"Internal Error: Invalid LaTeX generated! Error:\n```\n{e}\n```") from e
-        file = (await chat.get_ryver().upload_file("expression.png", img_data, "image/png")).get_file()
-        await chat.send_message(f"Simple expression: `{args}`  \nLaTeX: `{latex}`\n![{args}]({file.get_url()})", bot.msg_creator)
-    except lark.LarkError as e:
+        await chat.send_message(f"Simple expression: `{args}`  \nLaTeX: `{latex}`\n![{args}]({url})", bot.msg_creator)
+    except simplelatex.ParseError as e:
         raise CommandError(f"Error during expression parsing:\n```\n{e}\n```") from e
+    except concurrent.futures.process.BrokenProcessPool as e:
+        raise CommandError("Internal Error: The expression parser crashed! Try again later.") from e
     except asyncio.TimeoutError as e:
         raise CommandError("Operation timed out! Try entering a smaller expression or using LaTeX directly.") from e
 
@@ -200,7 +235,7 @@ async def command_help(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
                 resp += f"\n\n{group_desc}"
         if bot.config.aliases:
             resp += "\n\nCurrent Aliases:\n"
-            resp += "\n".join(f"* `{alias.from_}` \u2192 `{alias.to}`" for alias in bot.config.aliases)
+            resp += "\n".join(f"* `{from_}` \u2192 `{to}`" for from_, to in bot.config.aliases.items())
         if all_cmds:
             admins = ", ".join([bot.ryver.get_user(id=uid).get_name() for uid in bot.config.admins])
             if admins:
@@ -210,15 +245,16 @@ async def command_help(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
         resp += "\n\nFor more details about a command, try `@latexbot help <command>`. "
         resp += "Click [here](https://github.com/tylertian123/ryver-latexbot/blob/master/usage_guide.md) for a usage guide."
         await chat.send_message(resp, bot.msg_creator)
-    elif args in bot.command_help:
-        text = bot.command_help[args]
-        if await bot.commands.commands[args].is_authorized(bot, chat, user):
+    else:
+        entry = bot.help_index.get(args.lower())
+        if entry is None:
+            raise CommandError(f"{args} is not a valid command, or does not have an extended description.")
+        text, cmd = entry
+        if await cmd.is_authorized(bot, chat, user):
             text += "\n\n:white_check_mark: **You have access to this command.**"
         else:
             text += "\n\n:no_entry: **You do not have access to this command.**"
         await chat.send_message(text, bot.msg_creator)
-    else:
-        raise CommandError(f"{args} is not a valid command, or does not have an extended description.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
@@ -232,6 +268,234 @@ async def command_ping(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
     await chat.send_message("Pong", bot.msg_creator)
 
 
+def _parse_tba_args(args: typing.List[str], *syntax) -> typing.List[typing.Any]:
+    """
+    Parse the arguments of a tba sub-command (excluding the sub-command name itself).
+
+    Raises a CommandError if the arguments are invalid.
+    """
+    try:
+        return util.parse_args(args[1:], *syntax)
+    except ValueError as e:
+        raise CommandError(str(e)) from e
+
+
+async def _tba_team(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba team`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    team, = _parse_tba_args(args, ("team number", int))
+    await chat.send_message(TheBlueAlliance.format_team(await bot.tba.get_team(team)), bot.msg_creator)
+
+
+async def _tba_team_events(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba teamEvents`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    team, year = _parse_tba_args(args, ("team number", int), ("year", int, bot.current_time().year))
+    events, results = await asyncio.gather(bot.tba.get_team_events(team, year), bot.tba.get_team_events_statuses(team, year))
+    formatted_events = []
+    for event in events:
+        desc = TheBlueAlliance.format_event(event)
+        if results.get(event["key"]):
+            desc += "\n\n" + _markdownify_if_html(results[event["key"]]["overall_status_str"])
+        else:
+            desc += "\n\n**Could not obtain info for this team's performance during this event.**"
+        formatted_events.append(desc)
+    await chat.send_message("\n\n".join(formatted_events), bot.msg_creator)
+
+
+async def _tba_districts(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba districts`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    year, = _parse_tba_args(args, ("year", int, bot.current_time().year))
+    districts = await bot.tba.get_districts(year)
+    resp = f"# Districts for year {year}\n"
+    resp += "\n".join(f"- {district['display_name']} (**{district['abbreviation'].upper()}**)" for district in districts)
+    await chat.send_message(resp, bot.msg_creator)
+
+
+def _highlight_row(row: str) -> str:
+    """
+    Highlight every cell in a table row.
+    """
+    # Same as wrapping each cell from row.split("|"), but in a single pass
+    return "==" + row.replace("|", "==|==") + "=="
+
+
+_DISTRICT_RANKINGS_HEADER = "Rank|Total Points|Event 1|Event 2|District Championship|Rookie Bonus|Team Number|Team Name\n---|---|---|---|---|---|---|---\n"
+
+
+def _format_district_ranking_row(r: typing.Dict[str, typing.Any], team: typing.Dict[str, typing.Any], frc_team: int) -> str:
+    """
+    Format a row of the district rankings table.
+    """
+    event1 = r["event_points"][0]["total"] if r["event_points"] else "Not Played"
+    event2 = r["event_points"][1]["total"] if len(r["event_points"]) >= 2 else "Not Played"
+    dcmp = r["event_points"][2]["total"] if len(r["event_points"]) >= 3 else "Not Played"
+    if len(r["event_points"]) >= 4:
+        dcmp += r["event_points"][3]["total"]
+    row = f"{r['rank']}|{r['point_total']}|{event1}|{event2}|{dcmp}|{r['rookie_bonus']}|"
+    row += f"{team['team_number']}|[{team['nickname']}]({TheBlueAlliance.TEAM_URL}{team['team_number']})"
+    if team["team_number"] == frc_team:
+        row = _highlight_row(row)
+    return row
+
+
+async def _tba_district_rankings(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba districtRankings`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    dist, year, rng = _parse_tba_args(args, ("district code", None), ("year", int, bot.current_time().year), ("range", None, None))
+    key = str(year) + dist.lower()
+    rankings, dis_teams = await asyncio.gather(bot.tba.get_district_rankings(key), bot.tba.get_district_teams(key))
+    teams = {team["key"]: team for team in dis_teams}
+    if not rankings:
+        raise CommandError("No results.")
+    # Get the ranking for the organization team
+    team_rank = None
+    if bot.config.frc_team is not None:
+        by_key = {r["team_key"]: r for r in rankings}
+        team_rank = by_key.get("frc" + str(bot.config.frc_team))
+    # Parse the range
+    if rng:
+        try:
+            rankings = util.slice_range(rankings, rng)
+        except ValueError as e:
+            raise CommandError("Invalid range.") from e
+    if not rankings:
+        raise CommandError("No results.")
+    title = f"# Rankings for district {args[1]} in {year}:\n"
+    if team_rank is not None:
+        title += f"++Team {bot.config.frc_team} ({teams[team_rank['team_key']]['nickname']}) ranked "
+        title += f"**{util.ordinal(team_rank['rank'])}** out of {len(teams)} teams"
+        if not rankings[0]["rank"] <= team_rank["rank"] <= rankings[-1]["rank"]:
+            title += " (not included in the table below)"
+        title += ".++\n"
+    rows = [_format_district_ranking_row(r, teams[r["team_key"]], bot.config.frc_team) for r in rankings]
+    for page in util.paginate(rows, title, _DISTRICT_RANKINGS_HEADER):
+        await chat.send_message(page, bot.msg_creator)
+
+
+async def _tba_district_events(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba districtEvents`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    dist, year, rng = _parse_tba_args(args, ("district code", None), ("year", int, bot.current_time().year), ("range", None, None))
+    key = str(year) + dist.lower()
+    # Order by week
+    events = sorted(await bot.tba.get_district_events(key), key=lambda x: x["week"])
+    if not events:
+        raise CommandError("No results.")
+    # Parse the range
+    if rng:
+        try:
+            # A single number has a different behavior from the usual slicing
+            if rng.isdigit():
+                weeks = [int(rng)]
+            else:
+                # Slice to get the weeks that we want
+                # Account for 1-based indexing
+                weeks = util.slice_range(range(1, events[-1]["week"] + 2), rng)
+            events = [event for event in events if event["week"] + 1 in weeks]
+        except ValueError as e:
+            raise CommandError("Invalid range.") from e
+    if not events:
+        raise CommandError("No results.")
+    rows = [TheBlueAlliance.format_event(event) for event in events]
+    for page in util.paginate(rows, "", ""):
+        await chat.send_message(page, bot.msg_creator)
+
+
+async def _tba_event(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba event`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    event_code, year = _parse_tba_args(args, ("event code", None), ("year", int, bot.current_time().year))
+    event = await bot.tba.get_event(str(year) + event_code.lower())
+    await chat.send_message(TheBlueAlliance.format_event(event), bot.msg_creator)
+
+
+def _format_event_ranking_row(r: typing.Dict[str, typing.Any], sort_order_info: typing.List[typing.Dict[str, typing.Any]], frc_team: int) -> str:
+    """
+    Format a row of the event rankings table.
+    """
+    # The zip is used because sometimes sort_orders contain more values than names in sort_order_info
+    row = f"{r['rank']}|[{r['team_key'][3:]}]({TheBlueAlliance.TEAM_URL}{r['team_key'][3:]})|"
+    row += "|".join(str(stat) for stat, _ in zip(r["sort_orders"], sort_order_info))
+    row += f"|{r['record']['wins']}-{r['record']['losses']}-{r['record']['ties']}|{r['dq']}|{r['matches_played']}|"
+    row += "|".join(str(stat) for stat in r["extra_stats"])
+    if int(r["team_key"][3:]) == frc_team:
+        row = _highlight_row(row)
+    return row
+
+
+async def _tba_event_rankings(bot: "latexbot.LatexBot", chat: pyryver.Chat, args: typing.List[str]):
+    """
+    Handle `tba eventRankings`.
+    """
+    # pylint: disable=unbalanced-tuple-unpacking
+    event_code, year, rng = _parse_tba_args(args, ("event code", None), ("year", int, bot.current_time().year), ("range", None, None))
+    key = str(year) + event_code.lower()
+    rankings = await bot.tba.get_event_rankings(key)
+    if not rankings:
+        raise CommandError("No results.")
+    # Get the ranking for the organization team
+    team_rank = None
+    if bot.config.frc_team is not None:
+        by_key = {r["team_key"]: r for r in rankings["rankings"]}
+        team_rank = by_key.get("frc" + str(bot.config.frc_team))
+    if rng:
+        try:
+            team_rankings = util.slice_range(rankings["rankings"], rng)
+        except ValueError as e:
+            raise CommandError("Invalid range.") from e
+    else:
+        team_rankings = rankings["rankings"]
+    if not rankings:
+        raise CommandError("No results.")
+    title = f"# Rankings for event [{args[1]}]({TheBlueAlliance.EVENT_URL}{key}#rankings) in {year}:\n"
+    if team_rank is not None:
+        title += f"++Team {bot.config.frc_team} ranked **{util.ordinal(team_rank['rank'])}** out of {len(rankings['rankings'])} teams"
+        if not team_rankings[0]["rank"] <= team_rank["rank"] <= team_rankings[-1]["rank"]:
+            title += " (not included in the table below)"
+        title += ".++\n"
+    header = "Rank|Team|" + "|".join(i["name"] for i in rankings["sort_order_info"])
+    header += "|Record (W-L-T)|DQ|Matches Played|" + "|".join(i["name"] for i in rankings["extra_stats_info"]) + "\n"
+    header += "|".join("---" * (len(rankings["extra_stats_info"]) + len(rankings["sort_order_info"]) + 5))
+    header += "\n"
+    rows = [_format_event_ranking_row(r, rankings["sort_order_info"], bot.config.frc_team) for r in team_rankings]
+    for page in util.paginate(rows, title, header):
+        await chat.send_message(page, bot.msg_creator)
+
+
+# Sub-command handlers for tba, by abbreviated name
+_TBA_SUBCOMMANDS = {
+    "t": _tba_team,
+    "te": _tba_team_events,
+    "tes": _tba_team_events,
+    "d": _tba_districts,
+    "ds": _tba_districts,
+    "dr": _tba_district_rankings,
+    "drs": _tba_district_rankings,
+    "de": _tba_district_events,
+    "des": _tba_district_events,
+    "e": _tba_event,
+    "er": _tba_event_rankings,
+    "ers": _tba_event_rankings,
+}
+# Abbreviations for words in tba sub-commands
+_TBA_ABBREVIATIONS = {"team": "t", "district": "d", "event": "e", "ranking": "r"}
+_TBA_ABBREVIATION_REGEX = re.compile("|".join(_TBA_ABBREVIATIONS))
+
+
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
 async def command_tba(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -280,191 +544,18 @@ async def command_tba(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryve
     if bot.tba is None:
         raise CommandError("This feature is unavailable because no TBA API key was provided. Please set `LATEXBOT_TBA_KEY` to a TBA key.")
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
     if not args:
         raise CommandError("Please specify a sub-command! See `@latexbot help tba` for details.")
     # Abbreviations
-    args[0] = args[0].lower().replace("team", "t").replace("district", "d").replace("event", "e").replace("ranking", "r")
+    handler = _TBA_SUBCOMMANDS.get(_TBA_ABBREVIATION_REGEX.sub(lambda m: _TBA_ABBREVIATIONS[m.group()], args[0].lower()))
+    if handler is None:
+        raise CommandError("Invalid sub-command. Check `@latexbot help tba` to see valid commands.")
 
     try:
-        if args[0] == "t":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                team, = util.parse_args(args[1:], ("team number", int))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            await chat.send_message(TheBlueAlliance.format_team(await bot.tba.get_team(team)), bot.msg_creator)
-        elif args[0] == "te" or args[0] == "tes":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                team, year = util.parse_args(args[1:], ("team number", int), ("year", int, bot.current_time().year))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            events = await bot.tba.get_team_events(team, year)
-            results = await bot.tba.get_team_events_statuses(team, year)
-            formatted_events = []
-            for event in events:
-                desc = TheBlueAlliance.format_event(event)
-                if results.get(event["key"]):
-                    desc += "\n\n" + markdownify(results[event["key"]]["overall_status_str"])
-                else:
-                    desc += "\n\n**Could not obtain info for this team's performance during this event.**"
-                formatted_events.append(desc)
-            await chat.send_message("\n\n".join(formatted_events), bot.msg_creator)
-        elif args[0] == "ds" or args[0] == "d":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                year, = util.parse_args(args[1:], ("year", int, bot.current_time().year))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            districts = await bot.tba.get_districts(year)
-            resp = f"# Districts for year {year}\n"
-            resp += "\n".join(f"- {district['display_name']} (**{district['abbreviation'].upper()}**)" for district in districts)
-            await chat.send_message(resp, bot.msg_creator)
-        elif args[0] == "dr" or args[0] == "drs":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                dist, year, rng = util.parse_args(args[1:], ("district code", None), ("year", int, bot.current_time().year), ("range", None, None))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            key = str(year) + dist.lower()
-            rankings = await bot.tba.get_district_rankings(key)
-            dis_teams = await bot.tba.get_district_teams(key)
-            teams = {team["key"]: team for team in dis_teams}
-            if not rankings:
-                raise CommandError("No results.")
-            # Get the ranking for the organization team
-            team_rank = None
-            if bot.config.frc_team is not None:
-                team_key = "frc" + str(bot.config.frc_team)
-                for r in rankings:
-                    if team_key == r["team_key"]:
-                        team_rank = r
-                        break
-            # Parse the range
-            if rng:
-                try:
-                    rankings = util.slice_range(rankings, rng)
-                except ValueError as e:
-                    raise CommandError("Invalid range.") from e
-            if not rankings:
-                raise CommandError("No results.")
-            title = f"# Rankings for district {args[1]} in {year}:\n"
-            if team_rank is not None:
-                title += f"++Team {bot.config.frc_team} ({teams[team_rank['team_key']]['nickname']}) ranked "
-                title += f"**{util.ordinal(team_rank['rank'])}** out of {len(teams)} teams"
-                if not rankings[0]["rank"] <= team_rank["rank"] <= rankings[-1]["rank"]:
-                    title += " (not included in the table below)"
-                title += ".++\n"
-            header = "Rank|Total Points|Event 1|Event 2|District Championship|Rookie Bonus|Team Number|Team Name\n---|---|---|---|---|---|---|---\n"
-            def rankings_gen():
-                for r in rankings:
-                    team = teams[r["team_key"]]
-                    event1 = r["event_points"][0]["total"] if r["event_points"] else "Not Played"
-                    event2 = r["event_points"][1]["total"] if len(r["event_points"]) >= 2 else "Not Played"
-                    dcmp = r["event_points"][2]["total"] if len(r["event_points"]) >= 3 else "Not Played"
-                    if len(r["event_points"]) >= 4:
-                        dcmp += r["event_points"][3]["total"]
-                    row = f"{r['rank']}|{r['point_total']}|{event1}|{event2}|{dcmp}|{r['rookie_bonus']}|"
-                    row += f"{team['team_number']}|[{team['nickname']}]({TheBlueAlliance.TEAM_URL}{team['team_number']})"
-                    if team["team_number"] == bot.config.frc_team:
-                        row = "|".join(f"=={val}==" for val in row.split("|"))
-                    yield row
-            for page in util.paginate(rankings_gen(), title, header):
-                await chat.send_message(page, bot.msg_creator)
-        elif args[0] == "de" or args[0] == "des":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                dist, year, rng = util.parse_args(args[1:], ("district code", None), ("year", int, bot.current_time().year), ("range", None, None))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            key = str(year) + dist.lower()
-            # Order by week
-            events = sorted(await bot.tba.get_district_events(key), key=lambda x: x["week"])
-            if not events:
-                raise CommandError("No results.")
-            # Parse the range
-            if rng:
-                try:
-                    try:
-                        # See if the input can be parsed as a single int
-                        # since it has a different behavior as the usual slicing
-                        weeks = [int(rng)]
-                    except ValueError:
-                        # Slice to get the weeks that we want
-                        # Account for 1-based indexing
-                        weeks = util.slice_range(range(1, events[-1]["week"] + 2), rng)
-                    events = [event for event in events if event["week"] + 1 in weeks]
-                except ValueError as e:
-                    raise CommandError("Invalid range.") from e
-            if not events:
-                raise CommandError("No results.")
-            def events_gen():
-                for event in events:
-                    yield TheBlueAlliance.format_event(event)
-            for page in util.paginate(events_gen(), "", ""):
-                await chat.send_message(page, bot.msg_creator)
-        elif args[0] == "e":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                event_code, year = util.parse_args(args[1:], ("event code", None), ("year", int, bot.current_time().year))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            event = await bot.tba.get_event(str(year) + event_code.lower())
-            await chat.send_message(TheBlueAlliance.format_event(event), bot.msg_creator)
-        elif args[0] == "er" or args[0] == "ers":
-            try:
-                # pylint: disable=unbalanced-tuple-unpacking
-                event_code, year, rng = util.parse_args(args[1:], ("event code", None), ("year", int, bot.current_time().year), ("range", None, None))
-            except ValueError as e:
-                raise CommandError(str(e)) from e
-            key = str(year) + event_code.lower()
-            rankings = await bot.tba.get_event_rankings(key)
-            if not rankings:
-                raise CommandError("No results.")
-            # Get the ranking for the organization team
-            team_rank = None
-            if bot.config.frc_team is not None:
-                team_key = "frc" + str(bot.config.frc_team)
-                for r in rankings["rankings"]:
-                    if team_key == r["team_key"]:
-                        team_rank = r
-                        break
-            if rng:
-                try:
-                    team_rankings = util.slice_range(rankings["rankings"], rng)
-                except ValueError as e:
-                    raise CommandError("Invalid range.") from e
-            else:
-                team_rankings = rankings["rankings"]
-            if not rankings:
-                raise CommandError("No results.")
-            title = f"# Rankings for event [{args[1]}]({TheBlueAlliance.EVENT_URL}{key}#rankings) in {year}:\n"
-            if team_rank is not None:
-                title += f"++Team {bot.config.frc_team} ranked **{util.ordinal(team_rank['rank'])}** out of {len(rankings['rankings'])} teams"
-                if not team_rankings[0]["rank"] <= team_rank["rank"] <= team_rankings[-1]["rank"]:
-                    title += " (not included in the table below)"
-                title += ".++\n"
-            header = "Rank|Team|" + "|".join(i["name"] for i in rankings["sort_order_info"])
-            header += "|Record (W-L-T)|DQ|Matches Played|" + "|".join(i["name"] for i in rankings["extra_stats_info"]) + "\n"
-            header += "|".join("---" * (len(rankings["extra_stats_info"]) + len(rankings["sort_order_info"]) + 5))
-            header += "\n"
-            def rankings_gen():
-                for r in team_rankings:
-                    # The zip is used because sometimes sort_orders contain more values than names in sort_order_info
-                    row = f"{r['rank']}|[{r['team_key'][3:]}]({TheBlueAlliance.TEAM_URL}{r['team_key'][3:]})|"
-                    row += "|".join(str(stat) for stat, _ in zip(r["sort_orders"], rankings["sort_order_info"]))
-                    row += f"|{r['record']['wins']}-{r['record']['losses']}-{r['record']['ties']}|{r['dq']}|{r['matches_played']}|"
-                    row += "|".join(str(stat) for stat in r["extra_stats"])
-                    if int(r["team_key"][3:]) == bot.config.frc_team:
-                        row = "|".join(f"=={val}==" for val in row.split("|"))
-                    yield row
-            for page in util.paginate(rankings_gen(), title, header):
-                await chat.send_message(page, bot.msg_creator)
-        else:
-            raise CommandError("Invalid sub-command. Check `@latexbot help tba` to see valid commands.")
+        await handler(bot, chat, args)
     except aiohttp.ClientResponseError as e:
         if e.status == 404:
             raise CommandError("The requested info does not exist.") from e
@@ -472,6 +563,15 @@ async def command_tba(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryve
             raise CommandError(f"HTTP Error: {e}. Please try again.") from e
 
 
+# Accepted values for the match case and whole word options of watch add
+_WATCH_BOOL_ARGS = {
+    "true": True,
+    "yes": True,
+    "false": False,
+    "no": False,
+}
+
+
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
 async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -531,7 +631,7 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         return schemas.KeywordWatch(True, 180.0, [])
 
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
     if not args:
@@ -548,9 +648,9 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
             else:
                 resp += "\nActivity timeout is disabled.\n\n"
             if watches.keywords:
-                resp += "Your keyword watches are:"
-                for i, keyword in enumerate(watches.keywords):
-                    resp += f"\n{i + 1}. \"{keyword.keyword}\" (match case: {keyword.match_case}, whole word: {keyword.whole_word})"
+                resp += "Your keyword watches are:\n"
+                resp += "\n".join(f"{i + 1}. \"{keyword.keyword}\" (match case: {keyword.match_case}, whole word: {keyword.whole_word})"
+                                  for i, keyword in enumerate(watches.keywords))
             else:
                 resp += "You do not have any keyword watches."
         else:
@@ -563,22 +663,14 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
             raise CommandError("Invalid number of arguments. See `@latexbot help watch` for help.")
 
         if len(args) >= 3:
-            arg = args[2].lower()
-            if arg == "true" or arg == "yes":
-                match_case = True
-            elif arg == "false" or arg == "no":
-                match_case = False
-            else:
+            match_case = _WATCH_BOOL_ARGS.get(args[2].lower())
+            if match_case is None:
                 raise CommandError("Invalid argument for match case option. See `@latexbot help watch` for help.")
         else:
             match_case = False
         if len(args) >= 4:
-            arg = args[3].lower()
-            if arg == "true" or arg == "yes":
-                whole_word = True
-            elif arg == "false" or arg == "no":
-                whole_word = False
-            else:
+            whole_word = _WATCH_BOOL_ARGS.get(args[3].lower())
+            if whole_word is None:
                 raise CommandError("Invalid argument for whole word option. See `@latexbot help watch` for help.")
         else:
             whole_word = False
@@ -588,8 +680,8 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         if user.get_id() not in bot.keyword_watches:
             bot.keyword_watches[user.get_id()] = get_default_settings()
         bot.keyword_watches[user.get_id()].keywords.append(schemas.Keyword(args[1], whole_word=whole_word, match_case=match_case))
-        bot.save_watches()
-        bot.rebuild_automaton() # Could be optimized
+        bot.schedule_save_watches()
+        bot.invalidate_automaton()
         resp = f"Added watch for keyword \"{args[1]}\" (match case: {match_case}, whole word: {whole_word})."
         if not bot.keyword_watches[user.get_id()].on:
             resp += " Note: Your keyword watch notifications are currently off."
@@ -609,16 +701,16 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
             except (ValueError, IndexError) as e:
                 raise CommandError("Invalid number.", bot.msg_creator) from e
             await chat.send_message(f"Removed watch #{n + 1} for keyword \"{keyword.keyword}\" (match case: {keyword.match_case}, whole word: {keyword.whole_word}).", bot.msg_creator)
-        bot.save_watches()
-        bot.rebuild_automaton() # Could be optimized
+        bot.schedule_save_watches()
+        bot.invalidate_automaton()
     elif args[0] == "on" or args[0] == "off":
         if len(args) != 1:
             raise CommandError("Invalid number of arguments. See `@latexbot help watch` for help.")
         if user.get_id() not in bot.keyword_watches:
             bot.keyword_watches[user.get_id()] = get_default_settings()
         bot.keyword_watches[user.get_id()].on = True if args[0] == "on" else False
-        bot.rebuild_automaton()
-        bot.save_watches()
+        bot.invalidate_automaton()
+        bot.schedule_save_watches()
         await chat.send_message(f"Turned keyword watch notifications **{args[0]}**.", bot.msg_creator)
     elif args[0] == "activityTimeout":
         if len(args) != 2:
@@ -630,7 +722,7 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         if user.get_id() not in bot.keyword_watches:
             bot.keyword_watches[user.get_id()] = get_default_settings()
         bot.keyword_watches[user.get_id()].activity_timeout = timeout
-        bot.save_watches()
+        bot.schedule_save_watches()
         await chat.send_message("Activity timeout has been " + (f"set to {timeout} seconds." if timeout > 0 else "disabled."), bot.msg_creator)
     elif args[0] == "suppress":
         if len(args) != 2:
@@ -642,7 +734,7 @@ async def command_watch(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         if user.get_id() not in bot.keyword_watches:
             bot.keyword_watches[user.get_id()] = get_default_settings()
         bot.keyword_watches[user.get_id()].suppressed = time.time() + duration
-        bot.save_watches()
+        bot.schedule_save_watches()
         await chat.send_message(f"Keyword watches suppressed for {duration} seconds.", bot.msg_creator)
     else:
         raise CommandError("Invalid sub-command. See `@latexbot help watch` for help.")
@@ -662,16 +754,15 @@ async def command_what_do_you_think(bot: "latexbot.LatexBot", chat: pyryver.Chat
     """
     args = args.lower()
     # Match configured opinions
-    for opinion in bot.config.opinions:
-        if args in opinion.thing:
-            # Match user if required
-            if opinion.user:
-                if util.contains_ignorecase(user.get_username(), opinion.user):
-                    await chat.send_message(random.choice(opinion.opinion), bot.msg_creator)
-                    return
-            else:
+    for opinion in bot.config.opinions_index.get(args, ()):
+        # Match user if required
+        if opinion.user:
+            if util.contains_ignorecase(user.get_username(), opinion.user):
                 await chat.send_message(random.choice(opinion.opinion), bot.msg_creator)
                 return
+        else:
+            await chat.send_message(random.choice(opinion.opinion), bot.msg_creator)
+            return
     if hash(args) %2 == 0:
         message = random.choice(bot.config.wdyt_no_messages) if bot.config.wdyt_no_messages else ":thumbsdown:"
     else:
@@ -679,6 +770,10 @@ async def command_what_do_you_think(bot: "latexbot.LatexBot", chat: pyryver.Chat
     await chat.send_message(message, bot.msg_creator)
 
 
+# Comics by number; a comic never changes once posted, and there aren't many of them
+_XKCD_CACHE = {} # type: typing.Dict[int, typing.Dict[str, typing.Any]]
+
+
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
 async def command_xkcd(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -700,12 +795,25 @@ async def command_xkcd(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
         number = None
 
     try:
-        comic = await xkcd.get_comic(number)
+        comic = _XKCD_CACHE.get(number) if number else None
+        if comic is None:
+            comic = await xkcd.get_comic(number, session=bot.http_session)
+            if comic:
+                _XKCD_CACHE[comic["num"]] = comic
         if not comic:
             raise CommandError("This comic does not exist (404). Have this image of a turtle instead.\n\n![A turtle](https://cdn.britannica.com/66/195966-138-F9E7A828/facts-turtles.jpg)")
         await chat.send_message(xkcd.comic_to_str(comic), xkcd_creator)
     except aiohttp.ClientResponseError as e:
         raise CommandError(str(e)) from e
+    except asyncio.TimeoutError as e:
+        raise CommandError("Timed out while trying to get the comic.") from e
+
+
+def _format_holidays(title: str, holidays: typing.List[typing.Dict[str, typing.Any]]) -> str:
+    """
+    Format a list of holidays from Checkiday, with a title line.
+    """
+    return title + "\n" + "\n".join([f"* [{holiday['name']}]({holiday['url']})" for holiday in holidays])
 
 
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
@@ -723,19 +831,41 @@ async def command_checkiday(bot: "latexbot.LatexBot", chat: pyryver.Chat, user:
     > `@latexbot checkiday` - Get today's holidays.
     > `@latexbot checkiday 2020/05/12` - Get the holidays on May 12, 2020.
     """
-    url = f"https://www.checkiday.com/api/3/?d={args or bot.current_time().strftime('%Y/%m/%d')}"
-    async with aiohttp.request("GET", url) as resp:
-        if resp.status != 200:
-            raise CommandError(f"HTTP error while trying to get holidays: {resp}")
-        data = await resp.json()
-    if data["error"] != "none":
+    data = await _get_holidays(bot, args or bot.current_time().strftime("%Y/%m/%d"))
+    if data.get("error", "none") != "none":
         raise CommandError(data["error"])
-    if not data.get("holidays", None):
-        await chat.send_message(f"No holidays on {data['date']}.")
+    holidays = data.get("holidays")
+    if not holidays:
+        msg = f"No holidays on {data['date']}."
     else:
-        msg = f"Here is a list of all the holidays on {data['date']}:\n"
-        msg += "\n".join(f"* [{holiday['name']}]({holiday['url']})" for holiday in data["holidays"])
-        await chat.send_message(msg, bot.msg_creator)
+        msg = _format_holidays(f"Here is a list of all the holidays on {data['date']}:", holidays)
+    await chat.send_message(msg, bot.msg_creator)
+
+
+def _get_trivia_game(bot: "latexbot.LatexBot", chat_id: int) -> trivia.LatexBotTriviaGame:
+    """
+    Get the ongoing trivia game in a chat.
+
+    Raises a CommandError if there is no game in the chat.
+    """
+    game = bot.trivia_games.get(chat_id)
+    if game is None:
+        raise CommandError("Game not started! Use `@latexbot trivia start [category] [difficulty] [type]` to start a game.")
+    return game
+
+
+# Trivia difficulties and question types by name
+_TRIVIA_DIFFICULTIES = {
+    "easy": trivia.TriviaSession.DIFFICULTY_EASY,
+    "medium": trivia.TriviaSession.DIFFICULTY_MEDIUM,
+    "hard": trivia.TriviaSession.DIFFICULTY_HARD,
+    "all": None,
+}
+_TRIVIA_QUESTION_TYPES = {
+    "true/false": trivia.TriviaSession.TYPE_TRUE_OR_FALSE,
+    "multiple-choice": trivia.TriviaSession.TYPE_MULTIPLE_CHOICE,
+    "all": None,
+}
 
 
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
@@ -788,21 +918,14 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
     if args == "":
         raise CommandError("Please specify a sub-command! See `@latexbot help trivia` for details.")
     # Purge old games
-    for chat_id, game in bot.trivia_games.items():
-        if game.ended:
-            bot.trivia_games.pop(chat_id)
-    # Find the first whitespace
-    space = None
-    for i, c in enumerate(args):
-        if c.isspace():
-            space = i
-            break
-    if space:
-        cmd = args[:space]
-        sub_args = args[space + 1:]
-    else:
-        cmd = args
-        sub_args = ""
+    # Collect the IDs first, since the dict can't be modified while iterating over it
+    ended = [chat_id for chat_id, game in bot.trivia_games.items() if game.ended]
+    for chat_id in ended:
+        del bot.trivia_games[chat_id]
+    # Split off the sub-command at the first whitespace
+    parts = args.split(None, 1)
+    cmd = parts[0]
+    sub_args = parts[1] if len(parts) > 1 else ""
 
     if cmd == "exportCustomQuestions":
         if await bot.commands.commands["trivia exportCustomQuestions"].is_authorized(bot, chat, user):
@@ -831,6 +954,7 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
 
+    chat_id = chat.get_id()
     if cmd == "games":
         if not bot.trivia_games:
             await chat.send_message("No games are ongoing.", bot.msg_creator)
@@ -840,19 +964,20 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         await chat.send_message(resp, bot.msg_creator)
     elif cmd == "categories":
         # Note: The reason we're not starting from 0 here is because of markdown forcing you to start a list at 1
-        categories = "\n".join(f"{i + 1}. {category['name']}" for i, category in enumerate(await trivia.get_categories()))
+        lines = ["# Categories:"]
+        lines.extend(f"{i + 1}. {category['name']}" for i, category in enumerate(await trivia.get_categories()))
         custom_categories = trivia.get_custom_categories()
         if custom_categories:
-            categories += "\n\n# Custom categories:\n"
-            categories += "\n".join(f"* {category}" for category in custom_categories)
-            categories += "\n\nCustom categories can only be specified by name. Use 'all' for all regular categories (no custom), or 'custom' for all custom categories (no regular)."
-        await chat.send_message(f"# Categories:\n{categories}", bot.msg_creator)
+            lines.append("\n# Custom categories:")
+            lines.extend(f"* {category}" for category in custom_categories)
+            lines.append("\nCustom categories can only be specified by name. Use 'all' for all regular categories (no custom), or 'custom' for all custom categories (no regular).")
+        await chat.send_message("\n".join(lines), bot.msg_creator)
     elif cmd == "start":
         if len(sub_args) > 3:
             raise CommandError("Invalid syntax. See `@latexbot help trivia` for details.")
 
-        if chat.get_id() in bot.trivia_games:
-            game = bot.trivia_games[chat.get_id()]
+        if chat_id in bot.trivia_games:
+            game = bot.trivia_games[chat_id]
             raise CommandError(f"A game started by {game.get_user_name(game.game.host)} already exists in this chat.")
 
         # Try parsing the category
@@ -876,21 +1001,13 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
                 elif category == "custom":
                     category = "custom"
                 else:
-                    found = False
-                    for c in categories:
-                        # Case-insensitive search
-                        if c["name"].lower() == category:
-                            found = True
-                            category = c["id"]
-                            break
-                    if not found:
-                        for c in trivia.get_custom_categories():
-                            if c.lower() == category:
-                                found = True
-                                category = c
-                                break
-                    if not found:
+                    # Case-insensitive search
+                    category_id = trivia.get_category_ids(categories).get(category)
+                    if category_id is None:
+                        category_id = trivia.find_custom_category(category)
+                    if category_id is None:
                         raise CommandError("Invalid category. Please see `@latexbot trivia categories` for all valid categories.")
+                    category = category_id
         else:
             category = None
             difficulty = None
@@ -899,12 +1016,7 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         # Try parsing the difficulty
         if len(sub_args) >= 2:
             try:
-                difficulty = {
-                    "easy": trivia.TriviaSession.DIFFICULTY_EASY,
-                    "medium": trivia.TriviaSession.DIFFICULTY_MEDIUM,
-                    "hard": trivia.TriviaSession.DIFFICULTY_HARD,
-                    "all": None,
-                }[sub_args[1].lower()]
+                difficulty = _TRIVIA_DIFFICULTIES[sub_args[1].lower()]
             except KeyError as e:
                 raise CommandError("Invalid difficulty! Allowed difficulties are 'easy', 'medium', 'hard' or 'all'.") from e
         else:
@@ -914,11 +1026,7 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         # Try parsing the type
         if len(sub_args) >= 3:
             try:
-                question_type = {
-                    "true/false": trivia.TriviaSession.TYPE_TRUE_OR_FALSE,
-                    "multiple-choice": trivia.TriviaSession.TYPE_MULTIPLE_CHOICE,
-                    "all": None,
-                }[sub_args[2].lower()]
+                question_type = _TRIVIA_QUESTION_TYPES[sub_args[2].lower()]
             except KeyError as e:
                 raise CommandError("Invalid question type! Allowed types are 'true/false', 'multiple-choice' or 'all'.") from e
         else:
@@ -930,22 +1038,18 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         game.set_difficulty(difficulty)
         game.set_type(question_type)
         await game.start(user.get_id())
-        trivia_game = trivia.LatexBotTriviaGame(chat, game, bot.msg_creator)
-        bot.trivia_games[chat.get_id()] = trivia_game
+        trivia_game = trivia.LatexBotTriviaGame(chat, game, bot.msg_creator, bot.trivia_question_msgs)
+        bot.trivia_games[chat_id] = trivia_game
         await trivia_game._try_get_next()
 
         await chat.send_message("Game started! Use `@latexbot trivia question` to get the question.", bot.msg_creator)
     elif cmd == "question" or cmd == "next":
-        if chat.get_id() not in bot.trivia_games:
-            raise CommandError("Game not started! Use `@latexbot trivia start [category] [difficulty] [type]` to start a game.")
-        await bot.trivia_games[chat.get_id()].next_question()
+        await _get_trivia_game(bot, chat_id).next_question()
     elif cmd == "answer":
         if len(sub_args) != 1:
             raise CommandError("Invalid syntax. See `@latexbot help trivia` for details.")
-        if chat.get_id() not in bot.trivia_games:
-            raise CommandError("Game not started! Use `@latexbot trivia start [category] [difficulty] [type]` to start a game.")
 
-        game = bot.trivia_games[chat.get_id()]
+        game = _get_trivia_game(bot, chat_id)
         if game.game.current_question["answered"]:
             raise CommandError("The current question has already been answered. Use `@latexbot trivia question` to get the next question.")
 
@@ -971,13 +1075,9 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
 
         await game.answer(answer, user.get_id())
     elif cmd == "scores":
-        if chat.get_id() not in bot.trivia_games:
-            raise CommandError("Game not started! Use `@latexbot trivia start [category] [difficulty] [type]` to start a game.")
-        await bot.trivia_games[chat.get_id()].send_scores()
+        await _get_trivia_game(bot, chat_id).send_scores()
     elif cmd == "end":
-        if chat.get_id() not in bot.trivia_games:
-            raise CommandError("Game not started! Use `@latexbot trivia start [category] [difficulty] [type]` to start a game.")
-        game = bot.trivia_games[chat.get_id()]
+        game = _get_trivia_game(bot, chat_id)
         # Get the message object so we can check if the user is authorized
         if user.get_id() == game.game.host or await bot.commands.commands["trivia end"].is_authorized(bot, chat, user):
             # Display the scores
@@ -995,61 +1095,77 @@ async def command_trivia(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
                 await chat.send_message(resp, bot.msg_creator)
                 await game.send_scores()
             await game.end()
-            del bot.trivia_games[chat.get_id()]
+            del bot.trivia_games[chat_id]
         else:
             raise CommandError("Only the one who started the game or a Forum Admin or higher may end the game!")
     else:
         raise CommandError("Invalid sub-command! Please see `@latexbot help trivia` for all valid sub-commands.")
 
 
+async def _trivia_reaction_scores(game: trivia.LatexBotTriviaGame):
+    """
+    Handle the scoreboard reaction on a trivia question.
+    """
+    await game.send_scores()
+
+
+async def _trivia_reaction_next(game: trivia.LatexBotTriviaGame):
+    """
+    Handle the next question reaction on a trivia question.
+    """
+    if game.game.current_question["answered"]:
+        await game.next_question()
+
+
+# Handlers for reactions on a trivia question that aren't answers
+_TRIVIA_REACTION_HANDLERS = {
+    "trophy": _trivia_reaction_scores,
+    "fast_forward": _trivia_reaction_next,
+}
+# Answer numbers for reactions on true/false questions
+_TRIVIA_TRUE_FALSE_ANSWERS = {
+    "white_check_mark": 0,
+    "x": 1,
+}
+# All the reactions that mean something on a trivia question
+_TRIVIA_REACTIONS = frozenset([*_TRIVIA_REACTION_HANDLERS, *_TRIVIA_TRUE_FALSE_ANSWERS, *trivia.LatexBotTriviaGame.TRIVIA_NUMBER_EMOJIS])
+
+
 async def reaction_trivia(bot: "latexbot.LatexBot", ryver: pyryver.Ryver, session: pyryver.RyverWS, data: typing.Dict[str, typing.Any]): # pylint: disable=unused-argument
     """
     This coro does extra processing for interfacing trivia with reactions.
     """
     # Verify that this is an answer to a trivia question
-    if data["type"] != "Entity.ChatMessage":
+    if data["type"] != "Entity.ChatMessage" or data["reaction"] not in _TRIVIA_REACTIONS:
+        return
+    game = bot.trivia_question_msgs.get(data["id"])
+    if game is None:
+        return
+    user = ryver.get_user(id=data["userId"])
+    if user == bot.user:
         return
-    for game in bot.trivia_games.values():
-        if game.question_msg is None:
-            return
-        if data["id"] == game.question_msg.get_id():
-            user = ryver.get_user(id=data["userId"])
-            if user == bot.user:
-                return
-
-            # Scoreboard
-            if data["reaction"] == "trophy":
-                await game.send_scores()
-                return
 
-            # Next question
-            if data["reaction"] == "fast_forward":
-                if game.game.current_question["answered"]:
-                    await game.next_question()
-                return
+    # Scoreboard or next question
+    handler = _TRIVIA_REACTION_HANDLERS.get(data["reaction"])
+    if handler is not None:
+        await handler(game)
+        return
 
-            # Answer
-            if game.game.current_question["answered"]:
-                return
-            # Try to decode the reaction into an answer
-            if game.game.current_question["type"] == trivia.TriviaSession.TYPE_MULTIPLE_CHOICE:
-                try:
-                    answer = trivia.LatexBotTriviaGame.TRIVIA_NUMBER_EMOJIS.index(data["reaction"])
-                    # Give up if it's invalid
-                    if answer >= len(game.game.current_question["answers"]):
-                        return
-                except ValueError:
-                    return
-            else:
-                if data["reaction"] == "white_check_mark":
-                    answer = 0
-                elif data["reaction"] == "x":
-                    answer = 1
-                else:
-                    return
+    # Answer
+    if game.game.current_question["answered"]:
+        return
+    # Try to decode the reaction into an answer
+    if game.game.current_question["type"] == trivia.TriviaSession.TYPE_MULTIPLE_CHOICE:
+        answer = trivia.LatexBotTriviaGame.TRIVIA_NUMBER_EMOJI_INDEX.get(data["reaction"])
+        # Give up if it's invalid
+        if answer is None or answer >= len(game.game.current_question["answers"]):
+            return
+    else:
+        answer = _TRIVIA_TRUE_FALSE_ANSWERS.get(data["reaction"])
+        if answer is None:
+            return
 
-            await game.answer(answer, data["userId"])
-            break
+    await game.answer(answer, data["userId"])
 
 
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
@@ -1082,6 +1198,26 @@ async def command_leaderboards(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
     await chat.send_message(resp, bot.msg_creator)
 
 
+_RANGE_RE = re.compile(r"^\s*(?:(\d+)\s*-\s*)?(\d+)\s*$")
+
+
+def _parse_range(s: str) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Parse a message range of the form [<start>-]<end>.
+
+    Returns a tuple of (start, end), or None if the range is invalid.
+    If the start is not specified, it defaults to 1.
+    """
+    match = _RANGE_RE.match(s)
+    if match is None:
+        return None
+    start, end = int(match.group(1) or 1), int(match.group(2))
+    # Indices are 1-based, and a negative skip doesn't make sense for get_msgs_before()
+    if start < 1 or start > end:
+        return None
+    return start, end
+
+
 @command(access_level=Command.ACCESS_LEVEL_FORUM_ADMIN)
 async def command_delete_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -1100,27 +1236,14 @@ async def command_delete_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat,
     """
     if isinstance(chat, pyryver.User):
         raise CommandError("This command cannot be used in private messages.")
-    try:
-        # Try and parse the range
-        if "-" in args:
-            start = int(args[:args.index("-")].strip())
-            args = args[args.index("-") + 1:].strip()
-        else:
-            start = 1
-        end = int(args)
-    except (ValueError, IndexError) as e:
-        raise CommandError("Invalid syntax.") from e
-    if start > end:
-        raise CommandError("No messages to delete.")
+    rng = _parse_range(args)
+    if rng is None:
+        raise CommandError("Invalid syntax.")
+    start, end = rng
 
     try:
-        # Special case for start = 1
-        if start == 1:
-            msgs = await util.get_msgs_before(chat, msg_id, end)
-        else:
-            # Cut off the end (newer messages)
-            # Subtract 1 for 1-based indexing
-            msgs = (await util.get_msgs_before(chat, msg_id, end))[:-(start - 1)]
+        # Subtract 1 for 1-based indexing
+        msgs = await util.get_msgs_before(chat, msg_id, end - start + 1, skip=start - 1)
     except TimeoutError as e:
         raise CommandError("Something went wrong (TimeoutError in `get_msgs_before`). Please try again.") from e
     # Use multiple tasks
@@ -1135,6 +1258,14 @@ async def command_delete_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat,
         pass
 
 
+def _reactor_name(ryver: pyryver.Ryver, uid: int) -> str:
+    """
+    Get the display name of a user who reacted to a message, or 'unknown' if not found.
+    """
+    user = ryver.get_user(id=uid)
+    return user.get_display_name() if user else "unknown"
+
+
 @command(access_level=Command.ACCESS_LEVEL_FORUM_ADMIN)
 async def command_move_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -1157,26 +1288,17 @@ async def command_move_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
     """
     if isinstance(chat, pyryver.User):
         raise CommandError("This command cannot be used in private messages.")
-    try:
-        i = args.index(" ")
-        msg_range = args[:i]
-        to_chat = args[i + 1:]
-    except ValueError as e:
-        raise CommandError("Invalid syntax.") from e
+    msg_range, sep, to_chat = args.partition(" ")
+    if not sep:
+        raise CommandError("Invalid syntax.")
 
-    try:
-        # Try and parse the range
-        if "-" in msg_range:
-            start = int(msg_range[:msg_range.index("-")].strip())
-            msg_range = msg_range[msg_range.index("-") + 1:].strip()
-        else:
-            start = 1
-        end = int(msg_range)
-    except (ValueError, IndexError) as e:
-        raise CommandError("Invalid syntax.") from e
+    rng = _parse_range(msg_range)
+    if rng is None:
+        raise CommandError("Invalid syntax.")
+    start, end = rng
 
     try:
-        to = util.parse_chat_name(chat.get_ryver(), to_chat) # type: pyryver.Chat
+        to = bot.find_chat(to_chat) # type: pyryver.Chat
         if not to:
             raise CommandError("Chat not found.")
         if isinstance(to, pyryver.User):
@@ -1187,23 +1309,25 @@ async def command_move_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
         raise CommandError(str(e)) from e
 
     try:
-        # Special case for start = 1
-        if start == 1:
-            msgs = await util.get_msgs_before(chat, msg_id, end)
-        else:
-            # Cut off the end (newer messages)
-            # Subtract 1 for 1-based indexing
-            msgs = (await util.get_msgs_before(chat, msg_id, end))[:-(start - 1)]
+        # Subtract 1 for 1-based indexing
+        msgs = await util.get_msgs_before(chat, msg_id, end - start + 1, skip=start - 1)
     except TimeoutError as e:
         raise CommandError("Something went wrong (TimeoutError in `get_msgs_before`). Please try again.") from e
 
+    # Fetch the authors that aren't cached all at once, instead of one request per message while sending
+    uncached = {}
+    for msg in msgs:
+        if not msg.get_creator() and msg.get_author_id() not in uncached and bot.ryver.get_user(id=msg.get_author_id()) is None:
+            uncached[msg.get_author_id()] = msg
+    authors = dict(zip(uncached, await asyncio.gather(*(msg.get_author() for msg in uncached.values()))))
+
     await to.send_message(f"# Begin Moved Message from {chat.get_name()}\n\n---", bot.msg_creator)
 
     # Send the messages while merging messages from the same person to reduce the number of requests needed
     current_creator = None
     current_message = ""
     for msg in msgs:
-        msg_creator = await bot.get_replace_message_creator(msg)
+        msg_creator = await bot.get_replace_message_creator(msg, authors)
         # User changed
         if current_creator is None or current_creator.name != msg_creator.name or current_creator.avatar != msg_creator.avatar:
             # Send the accumulated message if it is not empty
@@ -1212,16 +1336,18 @@ async def command_move_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
             current_creator = msg_creator
             current_message = ""
 
-        msg_body = util.sanitize(msg.get_body())
+        parts = [await util.offload_if_large(util.sanitize, msg.get_body())]
         # Handle reactions
         # Because reactions are from multiple people they can't really be moved the same way
-        if msg.get_reactions():
-            msg_body += "\n"
-            for emoji, people in msg.get_reactions().items():
-                # Instead for each reaction, append a line at the bottom with the emoji
-                # and every user's display name who reacted with the reaction
-                u = [chat.get_ryver().get_user(id=person) for person in people]
-                msg_body += f"\n:{emoji}:: {', '.join([user.get_display_name() if user else 'unknown' for user in u])}"
+        reactions = msg.get_reactions()
+        if reactions:
+            # Instead for each reaction, append a line at the bottom with the emoji
+            # and every user's display name who reacted with the reaction
+            reaction_lines = "\n".join(
+                f":{emoji}:: {', '.join(_reactor_name(chat.get_ryver(), person) for person in people)}"
+                for emoji, people in reactions.items())
+            parts.append("\n\n" + reaction_lines)
+        msg_body = "".join(parts)
 
         # Flush the current message if it would be too long otherwise
         # Otherwise we may get a 400
@@ -1270,7 +1396,7 @@ async def command_move_messages(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
     # Note: This used to be done in the background while the messages were being sent, but apparently that causes problems?
     # Either way, doing them here makes sure the command doesn't eat up messages if it fails to replicate them
     worker_count = max(min(len(msgs) // 10, 15), 3)
-    await asyncio.ensure_future(util.process_concurrent(msgs, pyryver.ChatMessage.delete, workers=worker_count))
+    await util.process_concurrent(msgs, pyryver.ChatMessage.delete, workers=worker_count)
     try:
         await (await pyryver.retry_until_available(chat.get_message, msg_id, timeout=5.0)).delete()
     except TimeoutError:
@@ -1305,9 +1431,9 @@ async def command_count_messages_since(bot: "latexbot.LatexBot", chat: pyryver.C
         except re.error as e:
             raise CommandError("Invalid regex: " + str(e)) from e
     else:
-        args = args.lower()
         # Case insensitive match
-        match = lambda x: x.lower().find(args) != -1
+        # Escape the pattern so the search runs in C without lowercasing every message body
+        match = re.compile(re.escape(args), re.IGNORECASE).search
 
     count = 1
     # Max search depth: 500
@@ -1401,25 +1527,21 @@ async def command_mute(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryv
     elif bot.user_info[uid].muted is None:
         bot.user_info[uid].muted = {}
     muted = bot.user_info[uid].muted
-    # Remove the previous unmute task if it exists
-    task = muted.get(chat.get_id())
-    if task is not None and not task.done():
-        task.cancel()
-        await task
+    # Remove the previous unmute callback if it exists
+    handle = muted.get(chat.get_id())
+    if handle is not None:
+        handle.cancel()
     if duration is None:
         muted[chat.get_id()] = None
-        await chat.send_message(f"Muted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()}.", bot.msg_creator)
+        bot.send_in_background(chat, f"Muted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()}.")
     else:
-        # Define an unmute task that unmutes the user after the specified duration
-        async def _unmute_task():
-            try:
-                await asyncio.sleep(duration)
-                muted.pop(chat.get_id())
-                await chat.send_message(f"User {mute_user.get_name()} (`{mute_user.get_username()}`) has been unmuted in {chat.get_name()}.", bot.msg_creator)
-            except asyncio.CancelledError:
-                pass
-        muted[chat.get_id()] = asyncio.create_task(_unmute_task())
-        await chat.send_message(f"Muted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()} for {duration} seconds.", bot.msg_creator)
+        # Schedule a callback on the loop's timer heap to unmute the user after the specified duration
+        # This avoids keeping a sleeping task around for every mute
+        def _unmute():
+            muted.pop(chat.get_id(), None)
+            bot.send_in_background(chat, f"User {mute_user.get_name()} (`{mute_user.get_username()}`) has been unmuted in {chat.get_name()}.")
+        muted[chat.get_id()] = asyncio.get_event_loop().call_later(duration, _unmute)
+        bot.send_in_background(chat, f"Muted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()} for {duration} seconds.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_FORUM_ADMIN)
@@ -1450,11 +1572,10 @@ async def command_unmute(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         mute_level = await Command.get_access_level(chat, mute_user)
         if user_level <= mute_level:
             raise CommandError(f"You cannot unmute this user because they can use mute and have a higher access level than you ({mute_level} >= {user_level}).")
-    task = bot.user_info[mute_user.get_id()].muted.pop(chat.get_id())
-    if task is not None and not task.done():
-        task.cancel()
-        await task
-    await chat.send_message(f"Unmuted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()}.", bot.msg_creator)
+    handle = bot.user_info[mute_user.get_id()].muted.pop(chat.get_id())
+    if handle is not None:
+        handle.cancel()
+    bot.send_in_background(chat, f"Unmuted user {mute_user.get_name()} (`{mute_user.get_username()}`) in {chat.get_name()}.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -1603,7 +1724,7 @@ async def command_read_only(bot: "latexbot.LatexBot", chat: pyryver.Chat, user:
             bot.config.read_only_chats[chat] = []
         bot.config.read_only_chats[chat] = list(set(bot.config.read_only_chats[chat]) | set(args[1].split(",")))
         await chat.send_message(f"Roles added. New list of roles allowed to send messages here: {', '.join(bot.config.read_only_chats[chat])}.", bot.msg_creator)
-        bot.save_config()
+        bot.schedule_save_config()
     elif args[0] == "clear":
         if chat not in bot.config.read_only_chats:
             raise CommandError("This chat is not read-only.")
@@ -1623,7 +1744,7 @@ async def command_read_only(bot: "latexbot.LatexBot", chat: pyryver.Chat, user:
             else:
                 bot.config.read_only_chats[chat] = list(existing)
                 await chat.send_message(f"Roles removed. New list of roles allowed to send messages here: {', '.join(bot.config.read_only_chats[chat])}.", bot.msg_creator)
-        bot.save_config()
+        bot.schedule_save_config()
     else:
         raise CommandError("Invalid sub-command. See help for the available sub-commands.")    
 
@@ -1717,20 +1838,24 @@ async def command_add_to_role(bot: "latexbot.LatexBot", chat: pyryver.Chat, user
             continue
         if role not in bot.roles:
             bot.roles[role] = []
+        members = bot.roles[role]
+        # Use a set for membership checks; the list is kept for ordering and serialization
+        member_set = set(members)
 
         for username in usernames:
             user = bot.ryver.get_user(username=username)
             if user is None:
                 await chat.send_message(f"Warning: User `{username}` not found. Try updating the cache.", bot.msg_creator)
                 continue
-            if user.get_id() in bot.roles[role]:
+            if user.get_id() in member_set:
                 await chat.send_message(
                     f"Warning: User `{username}` already has role '{role}'.", bot.msg_creator)
             else:
-                bot.roles[role].append(user.get_id())
+                members.append(user.get_id())
+                member_set.add(user.get_id())
     bot.save_roles()
 
-    await chat.send_message("Operation successful.", bot.msg_creator)
+    bot.send_in_background(chat, "Operation successful.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -1762,22 +1887,28 @@ async def command_remove_from_role(bot: "latexbot.LatexBot", chat: pyryver.Chat,
             await chat.send_message(f"Error: The role {role} does not exist. Skipping...", bot.msg_creator)
             continue
 
+        member_set = set(bot.roles[role])
+        removed = set()
         for username in usernames:
             user = bot.ryver.get_user(username=username)
             if user is None:
                 await chat.send_message(f"Warning: User `{username}` not found. Try updating the cache.", bot.msg_creator)
                 continue
-            if user.get_id() not in bot.roles[role]:
+            if user.get_id() not in member_set:
                 await chat.send_message(f"Warning: User `{username}`` does not have the role {role}.", bot.msg_creator)
                 continue
-            bot.roles[role].remove(user.get_id())
+            member_set.discard(user.get_id())
+            removed.add(user.get_id())
+        # Remove all the users in one pass instead of one list.remove() per user
+        if removed:
+            bot.roles[role] = [uid for uid in bot.roles[role] if uid not in removed]
 
         # Delete empty roles
         if not bot.roles[role]:
             bot.roles.pop(role)
     bot.save_roles()
 
-    await chat.send_message("Operation successful.", bot.msg_creator)
+    bot.send_in_background(chat, "Operation successful.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -1802,7 +1933,7 @@ async def command_delete_role(bot: "latexbot.LatexBot", chat: pyryver.Chat, user
             await chat.send_message(f"Error: The role {role} does not exist. Skipping...", bot.msg_creator)
     bot.save_roles()
 
-    await chat.send_message("Operation successful.", bot.msg_creator)
+    bot.send_in_background(chat, "Operation successful.")
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -1816,7 +1947,7 @@ async def command_export_roles(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
     group: Roles Commands
     syntax:
     """
-    await util.send_json_data(chat, bot.roles.to_dict(), "Roles:", "roles.json", bot.user, bot.msg_creator)
+    await util.send_json_data(chat, bot.roles, "Roles:", "roles.json", bot.user, bot.msg_creator)
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -1832,31 +1963,40 @@ async def command_import_roles(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
     > `@latexbot importRoles {}` - Clear all roles.
     """
     try:
-        try:
-            data = await util.get_attached_json_data(await pyryver.retry_until_available(chat.get_message, msg_id, timeout=5.0), args)
-        except ValueError as e:
-            await chat.send_message(str(e), bot.msg_creator)
         msg = await pyryver.retry_until_available(chat.get_message, msg_id, timeout=5.0)
     except TimeoutError as e:
         raise CommandError("Something went wrong (TimeoutError). Please try again.") from e
-    file = msg.get_attached_file()
-    if file:
-        # Get the actual contents
-        try:
-            data = (await file.download_data()).decode("utf-8")
-        except aiohttp.ClientResponseError as e:
-            raise CommandError(f"Error while trying to GET file attachment: {e}") from e
-        except UnicodeDecodeError as e:
-            raise CommandError(f"File needs to be encoded with utf-8! The following decode error occurred: {e}") from e
-    else:
-        data = args
-
     try:
-        bot.roles = CaseInsensitiveDict(json.loads(data))
-        bot.save_roles()
-        await chat.send_message("Operation successful. Use `@latexbot roles` to view the updated roles.", bot.msg_creator)
-    except json.JSONDecodeError as e:
-        raise CommandError(f"Error decoding JSON: {e}") from e
+        data = await util.get_attached_json_data(msg, args)
+    except ValueError as e:
+        raise CommandError(str(e)) from e
+
+    bot.roles = CaseInsensitiveDict(data)
+    bot.save_roles()
+    await chat.send_message("Operation successful. Use `@latexbot roles` to view the updated roles.", bot.msg_creator)
+
+
+# Put between an event and its description
+# Note: The U+200B (Zero-Width Space) is so that Ryver won't turn ): into a sad face emoji
+_ZWSP_DESC_PREFIX = "\u200B:\n"
+# Markdown versions of event descriptions, keyed by (event ID, last updated time)
+_EVENT_DESCRIPTION_CACHE = {} # type: typing.Dict[typing.Tuple[str, str], str]
+_EVENT_DESCRIPTION_CACHE_SIZE = 512
+
+
+async def _event_description_markdown(event: typing.Dict[str, typing.Any]) -> str:
+    """
+    Convert an event's description to markdown, reusing the result if the event has not changed.
+    """
+    key = (event["id"], event.get("updated", ""))
+    text = _EVENT_DESCRIPTION_CACHE.get(key)
+    if text is None:
+        text = await util.offload_if_large(markdownify, event["description"])
+        if len(_EVENT_DESCRIPTION_CACHE) >= _EVENT_DESCRIPTION_CACHE_SIZE:
+            # Evict the oldest entry
+            del _EVENT_DESCRIPTION_CACHE[next(iter(_EVENT_DESCRIPTION_CACHE))]
+        _EVENT_DESCRIPTION_CACHE[key] = text
+    return text
 
 
 @command(access_level=Command.ACCESS_LEVEL_EVERYONE)
@@ -1888,9 +2028,10 @@ async def command_events(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
     upcoming = []
 
     # Process all the events
+    parse_time = Calendar.parse_time
     for event in events:
-        start = Calendar.parse_time(event["start"])
-        end = Calendar.parse_time(event["end"])
+        start = parse_time(event["start"])
+        end = parse_time(event["end"])
         # See if the event has started
         # If the date has no timezone info, make it the organization timezone for comparisons
         if not start.tzinfo:
@@ -1904,43 +2045,45 @@ async def command_events(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyr
         else:
             upcoming.append((event, start, end, has_time))
 
+    # Format of the start and end, by whether the event has a time
+    display_formats = {True: util.DATETIME_DISPLAY_FORMAT, False: util.DATE_DISPLAY_FORMAT}
+    parts = []
     if ongoing:
-        resp = "---------- Ongoing Events ----------"
+        parts.append("---------- Ongoing Events ----------")
         for evt in ongoing:
             event, start, end, has_time = evt
             # The day number of the event
             day = util.caldays_diff(now, start) + 1
             # If the event does not have a time, then don't include the time
-            start_str = datetime.strftime(start, util.DATETIME_DISPLAY_FORMAT if has_time else util.DATE_DISPLAY_FORMAT)
-            end_str = datetime.strftime(end, util.DATETIME_DISPLAY_FORMAT if has_time else util.DATE_DISPLAY_FORMAT)
-            resp += f"\n# Day *{day}* of {event['summary']} (*{start_str}* to *{end_str}*)"
-            if "description" in event and event["description"] != "":
-                # Note: The U+200B (Zero-Width Space) is so that Ryver won't turn ): into a sad face emoji
-                resp += f"\u200B:\n{markdownify(event['description'])}"
-        resp += "\n\n"
-    else:
-        resp = ""
+            display_format = display_formats[has_time]
+            start_str = start.strftime(display_format)
+            end_str = end.strftime(display_format)
+            parts.append(f"\n# Day *{day}* of {event['summary']} (*{start_str}* to *{end_str}*)")
+            if event.get("description"):
+                parts.append(_ZWSP_DESC_PREFIX + await _event_description_markdown(event))
+        parts.append("\n\n")
     if upcoming:
-        resp += "---------- Upcoming Events ----------"
+        parts.append("---------- Upcoming Events ----------")
         for evt in upcoming:
             event, start, end, has_time = evt
             # days until the event
             day = util.caldays_diff(start, now)
             # If the event does not have a time, then don't include the time
-            start_str = datetime.strftime(start, util.DATETIME_DISPLAY_FORMAT if has_time else util.DATE_DISPLAY_FORMAT)
-            end_str = datetime.strftime(end, util.DATETIME_DISPLAY_FORMAT if has_time else util.DATE_DISPLAY_FORMAT)
+            display_format = display_formats[has_time]
+            start_str = start.strftime(display_format)
+            end_str = end.strftime(display_format)
             if has_time and day == 0:
                 hours, seconds = divmod((start - now).seconds, 3600)
                 minutes, seconds = divmod(seconds, 60)
-                resp += f"\n# {hours}:{minutes:02d} "
+                parts.append(f"\n# {hours}:{minutes:02d} ")
             else:
-                resp += f"\n# {day} day{'s' * (day != 1)} "
-            resp += f"until {event['summary']} (*{start_str}* to *{end_str}*)"
-            if "description" in event and event["description"] != "":
-                # Note: The U+200B (Zero-Width Space) is so that Ryver won't turn ): into a sad face emoji
-                resp += f"\u200B:\n{markdownify(event['description'])}"
+                parts.append(f"\n# {day} day{'s' * (day != 1)} ")
+            parts.append(f"until {event['summary']} (*{start_str}* to *{end_str}*)")
+            if event.get("description"):
+                parts.append(_ZWSP_DESC_PREFIX + await _event_description_markdown(event))
     else:
-        resp += "***No upcoming events at the moment.***"
+        parts.append("***No upcoming events at the moment.***")
+    resp = "".join(parts)
 
     await chat.send_message(resp, bot.msg_creator)
 
@@ -1971,6 +2114,24 @@ async def command_quick_add_event(bot: "latexbot.LatexBot", chat: pyryver.Chat,
     await chat.send_message(f"Created event {event['summary']} (**{start_str}** to **{end_str}**).\nLink: {event['htmlLink']}", bot.msg_creator)
 
 
+# The (formats, kind) of each date/time argument of addEvent, by number of arguments
+_ADD_EVENT_ARG_SPECS = {
+    3: [(util.ALL_DATE_FORMATS, "date"), (util.ALL_DATE_FORMATS, "date")],
+    5: [(util.ALL_DATE_FORMATS, "date"), (util.ALL_TIME_FORMATS, "time"), (util.ALL_DATE_FORMATS, "date"), (util.ALL_TIME_FORMATS, "time")],
+}
+
+
+def _markdownify_if_html(text: str) -> str:
+    """
+    Convert text to markdown with markdownify, unless it contains no HTML tags or entities.
+
+    Descriptions typed by users are usually plain text, so parsing them as HTML is unnecessary.
+    """
+    if "<" not in text and "&" not in text:
+        return text
+    return markdownify(text)
+
+
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
 async def command_add_event(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -2001,77 +2162,67 @@ async def command_add_event(bot: "latexbot.LatexBot", chat: pyryver.Chat, user:
     > `@latexbot addEvent "Foo Bar" "Jan 1, 2020" "Jan 2, 2020"` - An alternative syntax for creating the same event.
     > `@latexbot addEvent Foo 2020-01-01 00:00 2020-01-01 12:00` - Add an event named "Foo", starting midnight on 2020-01-01 and ending 12 PM on the same day.
     """
-    if bot.config.calendar is None:
+    calendar = bot.config.calendar
+    if calendar is None:
         raise CommandError("This feature is unavailable because no calendar ID or service account credentials were configured.")
     # If a description is included
-    if "\n" in args:
-        i = args.index("\n")
-        desc = args[i + 1:]
-        args = args[:i]
-    else:
+    args, sep, desc = args.partition("\n")
+    if not sep:
         desc = None
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
     if len(args) != 3 and len(args) != 5:
         raise CommandError("Invalid syntax. Check `@latexbot help addEvent` for help. You may have to use quotes if any of the parameters contain spaces.")
 
+    # Parse each date/time argument, stopping at the first invalid one
+    parsed = []
+    for i, (formats, kind) in enumerate(_ADD_EVENT_ARG_SPECS[len(args)], 1):
+        value = util.tryparse_datetime(args[i], formats)
+        if not value:
+            raise CommandError(f"The {kind} {args[i]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
+        parsed.append(value)
+
     # No times specified
     if len(args) == 3:
-        start = util.tryparse_datetime(args[1], util.ALL_DATE_FORMATS)
-        if not start:
-            raise CommandError(f"The date {args[1]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-        end = util.tryparse_datetime(args[2], util.ALL_DATE_FORMATS)
-        if not end:
-            raise CommandError(f"The date {args[2]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-        event_body = {
-            "start": {
-                "date": datetime.strftime(start, util.CALENDAR_DATE_FORMAT),
-            },
-            "end": {
-                "date": datetime.strftime(end, util.CALENDAR_DATE_FORMAT),
-            }
-        }
+        start, end = parsed
+        event_body = Calendar.make_all_day_event(args[0], start, end, desc)
     else:
-        start_date = util.tryparse_datetime(args[1], util.ALL_DATE_FORMATS)
-        if not start_date:
-            raise CommandError(f"The date {args[1]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-        start_time = util.tryparse_datetime(args[2], util.ALL_TIME_FORMATS)
-        if not start_time:
-            raise CommandError(f"The time {args[2]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-
-        end_date = util.tryparse_datetime(args[3], util.ALL_DATE_FORMATS)
-        if not end_date:
-            raise CommandError(f"The date {args[3]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-        end_time = util.tryparse_datetime(args[4], util.ALL_TIME_FORMATS)
-        if not end_time:
-            raise CommandError(f"The time {args[4]} uses an invalid format. Check `@latexbot help addEvent` for valid formats.")
-
+        start_date, start_time, end_date, end_time = parsed
         # Merge to get datetimes
         start = datetime.combine(start_date, start_time.time())
         end = datetime.combine(end_date, end_time.time())
-        event_body = {
-            "start": {
-                "dateTime": start.isoformat(),
-                "timeZone": bot.config.tz_str,
-            },
-            "end": {
-                "dateTime": end.isoformat(),
-                "timeZone": bot.config.tz_str,
-            }
-        }
-    event_body["summary"] = args[0]
-    if desc:
-        event_body["description"] = desc
-    event = bot.config.calendar.add_event(event_body)
+        event_body = Calendar.make_timed_event(args[0], start, end, bot.config.tz_str, desc)
+    event = calendar.add_event(event_body)
     start_str = datetime.strftime(start, util.DATETIME_DISPLAY_FORMAT if len(args) == 5 else util.DATE_DISPLAY_FORMAT)
     end_str = datetime.strftime(end, util.DATETIME_DISPLAY_FORMAT if len(args) == 5 else util.DATE_DISPLAY_FORMAT)
     if not desc:
         await chat.send_message(f"Created event {event['summary']} (**{start_str}** to **{end_str}**).\nLink: {event['htmlLink']}", bot.msg_creator)
     else:
         # Note: The U+200B (Zero-Width Space) is so that Ryver won't turn ): into a sad face emoji
-        await chat.send_message(f"Created event {event['summary']} (**{start_str}** to **{end_str}**)\u200B:\n{markdownify(event['description'])}\n\nLink: {event['htmlLink']}", bot.msg_creator)
+        await chat.send_message(f"Created event {event['summary']} (**{start_str}** to **{end_str}**)\u200B:\n{_markdownify_if_html(event['description'])}\n\nLink: {event['htmlLink']}", bot.msg_creator)
+
+
+def _find_event(events: typing.List[typing.Dict[str, typing.Any]], name: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """
+    Find an event by name (case-insensitive).
+
+    An exact match is preferred, then a prefix match, then any other partial match.
+    Within each kind the earliest event wins. Returns None if nothing matches.
+    """
+    name = name.lower()
+    prefix_match = None
+    partial_match = None
+    for event in events:
+        summary = event["summary"].lower()
+        if summary == name:
+            return event
+        if prefix_match is None and summary.startswith(name):
+            prefix_match = event
+        elif partial_match is None and name in summary:
+            partial_match = event
+    return prefix_match or partial_match
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -2080,6 +2231,7 @@ async def command_delete_event(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
     Delete an event by name from Google Calendar.
 
     Note that the event name only has to be a partial match, and is case-insensitive.
+    Exact matches are preferred over matches at the start of the name, which are preferred over other partial matches.
     Therefore, try to be as specific as possible to avoid accidentally deleting the wrong event.
 
     This command can only remove events that have not ended.
@@ -2093,15 +2245,8 @@ async def command_delete_event(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
     """
     if bot.config.calendar is None:
         raise CommandError("This feature is unavailable because no calendar ID or service account credentials were configured.")
-    args = args.lower()
     events = bot.config.calendar.get_upcoming_events()
-    matched_event = None
-
-    for event in events:
-        # Found a match
-        if args in event["summary"].lower():
-            matched_event = event
-            break
+    matched_event = _find_event(events, args)
 
     if matched_event:
         bot.config.calendar.remove_event(matched_event["id"])
@@ -2127,12 +2272,12 @@ async def command_set_enabled(bot: "latexbot.LatexBot", chat: pyryver.Chat, user
     raise CommandError(f"Invalid option: {args}")
 
 
-KILL_MSGS = [
+KILL_MSGS = (
     "Goodbye, world.",
     "Bleh I'm dead",
     "x_x",
     "Goodbye cruel world",
-]
+)
 
 
 @command(access_level=Command.ACCESS_LEVEL_BOT_ADMIN)
@@ -2168,17 +2313,15 @@ async def command_sleep(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
     await chat.send_message("Good night! :sleeping:", bot.msg_creator)
     bot.enabled = False
     await bot.session.send_presence_change(pyryver.RyverWS.PRESENCE_AWAY)
-    async def _wakeup_task():
-        try:
-            await asyncio.sleep(secs)
-        except asyncio.CancelledError:
-            pass
-        finally:
-            if not bot.enabled:
-                bot.enabled = True
-                await bot.session.send_presence_change(pyryver.RyverWS.PRESENCE_AVAILABLE)
-                await chat.send_message("Good morning!", bot.msg_creator)
-    asyncio.create_task(_wakeup_task())
+    async def _wakeup():
+        if not bot.enabled:
+            bot.enabled = True
+            await bot.session.send_presence_change(pyryver.RyverWS.PRESENCE_AVAILABLE)
+            await chat.send_message("Good morning!", bot.msg_creator)
+    # Only the latest sleep should wake me up
+    if bot.wakeup_handle is not None:
+        bot.wakeup_handle.cancel()
+    bot.wakeup_handle = asyncio.get_event_loop().call_later(secs, lambda: bot.run_in_background(_wakeup()))
 
 
 @command(access_level=Command.ACCESS_LEVEL_MAINTAINER)
@@ -2200,11 +2343,20 @@ async def command_execute(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: py
     stderr = sys.stderr
     # Merge stdout and stderr
     try:
-        sys.stdout = io.StringIO()
+        # Limit the output to what fits in a single message
+        sys.stdout = util.BoundedStringIO(3900)
         sys.stderr = sys.stdout
-        exec("async def __aexec_func(bot, chat, user, msg_id, args):\n" + textwrap.indent(textwrap.dedent(args), "    "), globals(), locals()) # pylint: disable=exec-used
+        # Put the code into the body of an async function at the AST level
+        # so it doesn't have to be indented and compiled as a string
+        module = ast.parse("async def __aexec_func(bot, chat, user, msg_id, args): pass")
+        body = ast.parse(textwrap.dedent(args)).body
+        if body:
+            module.body[0].body = body
+        exec(compile(module, "<execute>", "exec"), globals(), locals()) # pylint: disable=exec-used
         await locals()["__aexec_func"](bot, chat, user, msg_id, args)
         output = sys.stdout.getvalue()
+        if sys.stdout.truncated:
+            output += "\n...[output truncated]"
         await chat.send_message(output, bot.msg_creator)
     except Exception: # pylint: disable=broad-except
         await chat.send_message(f"An exception has occurred:\n```\n{format_exc()}\n```", bot.msg_creator)
@@ -2294,34 +2446,27 @@ async def command_alias(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         if not bot.config.aliases:
             resp = "No aliases have been created."
         else:
-            resp = "All aliases:"
-            for alias in bot.config.aliases:
-                resp += f"\n* `{alias.from_}` \u2192 `{alias.to}`"
+            resp = "All aliases:\n" + "\n".join(f"* `{from_}` \u2192 `{to}`" for from_, to in bot.config.aliases.items())
         await chat.send_message(resp, bot.msg_creator)
         return
 
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
     if args[0] == "create":
         if len(args) != 3:
             raise CommandError("Invalid syntax. Did you forget the quotes?")
-        bot.config.aliases.append(schemas.Alias(args[1], args[2]))
-        bot.save_config()
+        bot.config.aliases[args[1]] = args[2]
+        bot.schedule_save_config()
         await chat.send_message(f"Successfully created alias `{args[1]}` \u2192 `{args[2]}`.", bot.msg_creator)
     elif args[0] == "delete":
         if len(args) != 2:
             raise CommandError("Invalid syntax.")
-
-        for i, alias in enumerate(bot.config.aliases):
-            if alias.from_ == args[1]:
-                del bot.config.aliases[i]
-                bot.save_config()
-                await chat.send_message(f"Successfully deleted alias `{args[1]}`.", bot.msg_creator)
-                break
-        else:
+        if bot.config.aliases.pop(args[1], None) is None:
             raise CommandError("Alias not found!")
+        bot.schedule_save_config()
+        await chat.send_message(f"Successfully deleted alias `{args[1]}`.", bot.msg_creator)
     else:
         raise CommandError("Invalid action. Allowed actions are create, delete and no argument (view).")
 
@@ -2368,7 +2513,7 @@ async def command_macro(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         return
 
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
     if args[0] == "create":
@@ -2376,11 +2521,11 @@ async def command_macro(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
             raise CommandError("You are not allowed to do that.")
         if len(args) != 3:
             raise CommandError("Invalid syntax. Did you forget the quotes?")
-        s = set(args[1])
-        if not s.issubset(util.MACRO_CHARS):
-            raise CommandError(f"Invalid character(s) for a macro name: {s - util.MACRO_CHARS}")
+        invalid = args[1].translate(util.INVALID_MACRO_CHARS_TRANS)
+        if invalid:
+            raise CommandError(f"Invalid character(s) for a macro name: {set(invalid)}")
         bot.config.macros[args[1]] = args[2]
-        bot.save_config()
+        bot.schedule_save_config()
         await chat.send_message(f"Successfully created macro `{args[1]}` expands to `{args[2]}`.", bot.msg_creator)
     elif args[0] == "delete":
         if not await bot.commands.commands["macro delete"].is_authorized(bot, chat, user):
@@ -2390,7 +2535,7 @@ async def command_macro(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyry
         if args[1] not in bot.config.macros:
             raise CommandError("Macro not found!")
         bot.config.macros.pop(args[1])
-        bot.save_config()
+        bot.schedule_save_config()
         await chat.send_message(f"Successfully deleted macro `{args[1]}`.", bot.msg_creator)
     else:
         raise CommandError("Invalid action. Allowed actions are create, delete and no argument (view).")
@@ -2425,7 +2570,7 @@ async def command_import_config(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
             chat.get_message, msg_id, timeout=5.0), args)
         errs = await bot.load_config(data)
         bot.update_help()
-        bot.save_config()
+        bot.schedule_save_config()
         if errs:
             logger.warning(f"Errors importing config from command: {errs}")
             await chat.send_message(errs, bot.msg_creator)
@@ -2437,6 +2582,35 @@ async def command_import_config(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
         await chat.send_message(f"Invalid JSON: {e}", bot.msg_creator)
 
 
+_ACCESS_RULE_HELP_HINT = "See `@latexbot help accessRule` for details."
+# Maps rule type names accepted by accessRule to AccessRule attribute names
+_ACCESS_RULE_ATTR_NAMES = {
+    "allowUser": "allow_users",
+    "disallowUser": "disallow_users",
+    "allowRole": "allow_roles",
+    "disallowRole": "disallow_roles",
+    "allow_user": "allow_users",
+    "disallow_user": "disallow_users",
+    "allow_role": "allow_roles",
+    "disallow_role": "disallow_roles",
+    "allow_users": "allow_users",
+    "disallow_users": "disallow_users",
+    "allow_roles": "allow_roles",
+    "disallow_roles": "disallow_roles",
+}
+
+
+def _format_access_rules_cached(bot: "latexbot.LatexBot", command: str) -> str:
+    """
+    Format a command's access rules, reusing the result from last time if possible.
+    """
+    cache = bot.config.access_rules_render_cache
+    text = cache.get(command)
+    if text is None:
+        text = cache[command] = util.format_access_rules(bot.ryver, command, bot.config.access_rules[command])
+    return text
+
+
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
 async def command_access_rule(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -2487,75 +2661,63 @@ async def command_access_rule(bot: "latexbot.LatexBot", chat: pyryver.Chat, user
     > `@latexbot accessRule ping add allowRole Pingers` - Allow the "pingers" role to access the ping command regardless of their access level.
     > `@latexbot accessRule ping add disallowUser tylertian` - Disallow tylertian from accessing the ping command regardless of his access level.
     """
+    access_rules = bot.config.access_rules
     if args == "":
-        if not bot.config.access_rules:
+        if not access_rules:
             await chat.send_message("No access rules were created.", bot.msg_creator)
         else:
-            for page in util.paginate((util.format_access_rules(bot.ryver, k, v) for k, v in bot.config.access_rules.items()), "All access rules:\n", sep="\n\n"):
+            for page in util.paginate((_format_access_rules_cached(bot, k) for k in access_rules), "All access rules:\n", sep="\n\n"):
                 await chat.send_message(page, bot.msg_creator)
         return
     try:
-        args = shlex.split(args)
+        args = util.fast_shlex_split(args)
     except ValueError as e:
         raise CommandError(f"Invalid syntax: {e}") from e
 
-    ATTR_NAMES = {
-        "allowUser": "allow_users",
-        "disallowUser": "disallow_users",
-        "allowRole": "allow_roles",
-        "disallowRole": "disallow_roles",
-        "allow_user": "allow_users",
-        "disallow_user": "disallow_users",
-        "allow_role": "allow_roles",
-        "disallow_role": "disallow_roles",
-        "allow_users": "allow_users",
-        "disallow_users": "disallow_users",
-        "allow_roles": "allow_roles",
-        "disallow_roles": "disallow_roles",
-    }
+    cmds = bot.commands.commands
     # Only command name is given - show access rules
     if len(args) == 1:
-        if args[0] not in bot.commands.commands:
+        if args[0] not in cmds:
             raise CommandError("Invalid command.")
-        if args[0] in bot.config.access_rules:
-            await chat.send_message(util.format_access_rules(bot.ryver, args[0], bot.config.access_rules[args[0]]), bot.msg_creator)
+        if args[0] in access_rules:
+            await chat.send_message(_format_access_rules_cached(bot, args[0]), bot.msg_creator)
         else:
             await chat.send_message(f"No access rules for command {args[0]}.", bot.msg_creator)
     # If both command name and action are given, then rule type and args must be given
     elif len(args) < 3:
-        await chat.send_message("Invalid syntax! See `@latexbot help accessRule` for details.", bot.msg_creator)
+        raise CommandError("Invalid syntax! " + _ACCESS_RULE_HELP_HINT)
     else:
         # Verify arguments are correct
-        if args[0] not in bot.commands.commands:
+        if args[0] not in cmds:
             raise CommandError("Invalid command.")
         if args[1] == "set":
             if args[2] != "level":
-                raise CommandError(f"Invalid rule type for action `set`: {args[2]}. See `@latexbot help accessRule` for details.")
+                raise CommandError(f"Invalid rule type for action `set`: {args[2]}. {_ACCESS_RULE_HELP_HINT}")
             if len(args) != 4:
                 raise CommandError("The `set` action takes exactly 1 argument.")
             try:
                 level = int(args[3])
             except ValueError as e:
-                raise CommandError(f"Invalid access level: {args}. Access levels must be integers. See `@latexbot help accessRule` for details.") from e
+                raise CommandError(f"Invalid access level: {args[3]}. Access levels must be integers. {_ACCESS_RULE_HELP_HINT}") from e
             # Set the rules
-            rules = bot.config.access_rules.get(args[0])
+            rules = access_rules.get(args[0])
             if rules is None:
                 rules = schemas.AccessRule(level=level)
             else:
                 rules.level = level
-            bot.config.access_rules[args[0]] = rules
+            access_rules[args[0]] = rules
         # Combine the two because they're similar
         elif args[1] == "add" or args[1] == "remove":
             if len(args) < 4:
-                raise CommandError(f"At least one argument must be supplied for action `{args[1]}`. See `@latexbot help accessRule` for details.")
+                raise CommandError(f"At least one argument must be supplied for action `{args[1]}`. {_ACCESS_RULE_HELP_HINT}")
             # Set the rules
-            rules = bot.config.access_rules.get(args[0])
+            rules = access_rules.get(args[0])
             if rules is None:
                 rules = schemas.AccessRule()
-                bot.config.access_rules[args[0]] = rules
-            attrname = ATTR_NAMES.get(args[2])
+                access_rules[args[0]] = rules
+            attrname = _ACCESS_RULE_ATTR_NAMES.get(args[2])
             if attrname is None:
-                raise CommandError(f"Invalid rule type name; allowed names are ({', '.join(ATTR_NAMES.keys())}).")
+                raise CommandError(f"Invalid rule type name; allowed names are ({', '.join(_ACCESS_RULE_ATTR_NAMES.keys())}).")
             # Handle @mention syntax usernames
             items = [item[1:] if item.startswith("@") else item for item in args[3:]]
             if args[2] in ("allowUser", "disallowUser"):
@@ -2578,42 +2740,50 @@ async def command_access_rule(bot: "latexbot.LatexBot", chat: pyryver.Chat, user
                         await chat.send_message(f"Warning: {item} is already in the list for rule {args[2]}.", bot.msg_creator)
                     else:
                         existing.append(item)
+                        existing_set.add(item)
             else:
                 if getattr(rules, attrname) is None:
                     raise CommandError(f"Rule {args[2]} is not set for command {args[0]}.")
-                existing = getattr(rules, attrname)
-                # Remove each one
+                existing_set = set(getattr(rules, attrname))
+                to_remove = set()
                 for item in items:
-                    if item not in existing:
+                    if item not in existing_set:
                         await chat.send_message(f"Warning: {item} is not in the list for rule {args[2]}.", bot.msg_creator)
                     else:
-                        existing.remove(item)
+                        existing_set.discard(item)
+                        to_remove.add(item)
+                # Remove them all in one pass, keeping the original order
+                existing = [item for item in getattr(rules, attrname) if item not in to_remove]
                 # Don't leave empty lists
-                if not existing:
-                    setattr(rules, attrname, None)
+                setattr(rules, attrname, existing or None)
             # Don't leave empty dicts
             if not rules:
-                bot.config.access_rules.pop(args[0])
+                access_rules.pop(args[0])
         elif args[1] == "delete":
             if len(args) != 3:
                 raise CommandError("The `delete` action does not take any arguments.")
-            attrname = ATTR_NAMES.get(args[2])
+            attrname = _ACCESS_RULE_ATTR_NAMES.get(args[2])
             if attrname is None:
-                raise CommandError(f"Invalid rule type name; allowed names are ({', '.join(ATTR_NAMES.keys())}).")
-            rules = bot.config.access_rules.get(args[0])
+                raise CommandError(f"Invalid rule type name; allowed names are ({', '.join(_ACCESS_RULE_ATTR_NAMES.keys())}).")
+            rules = access_rules.get(args[0])
             if rules is None or getattr(rules, attrname) is None:
                 raise CommandError(f"Command {args[0]} does not have rule {args[2]} set.")
             setattr(rules, attrname, None)
             if not rules:
-                bot.config.access_rules.pop(args[0])
+                access_rules.pop(args[0])
         else:
-            raise CommandError(f"Invalid action: {args[1]}. See `@latexbot help accessRule` for details.")
+            raise CommandError(f"Invalid action: {args[1]}. {_ACCESS_RULE_HELP_HINT}")
 
+        bot.config.access_rules_render_cache.pop(args[0], None)
         bot.update_help()
-        bot.save_config()
+        bot.schedule_save_config()
         await chat.send_message("Operation successful.", bot.msg_creator)
 
 
+# Accepts the same times as strptime("%H:%M"), but only with ASCII digits
+_DAILY_MESSAGE_TIME_RE = re.compile(r"([0-9]{1,2}):([0-9]{1,2})")
+
+
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
 async def command_set_daily_message_time(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -2631,22 +2801,113 @@ async def command_set_daily_message_time(bot: "latexbot.LatexBot", chat: pyryver
     if args == "" or args.lower() == "off":
         bot.config.daily_message_time = None
     else:
-        # Try parse to ensure validity
+        # Parse the fields directly instead of through strptime
+        # replace() validates the ranges of the hour and minute
+        match = _DAILY_MESSAGE_TIME_RE.fullmatch(args)
+        if match is None:
+            raise CommandError("Invalid time format.")
         try:
-            bot.config.daily_message_time = datetime.strptime(args, "%H:%M").time()
+            bot.config.daily_message_time = datetime.min.replace(hour=int(match.group(1)), minute=int(match.group(2))).time()
         except ValueError as e:
             raise CommandError("Invalid time format.") from e
 
     # Schedule or unschedule the daily message task
     bot.schedule_daily_message()
 
-    bot.save_config()
+    bot.schedule_save_config()
     if bot.config.daily_message_time:
         await chat.send_message(f"Messages will now be sent at {args} daily.", bot.msg_creator)
     else:
         await chat.send_message("Messages have been disabled.", bot.msg_creator)
 
 
+# How long Checkiday results are cached for (in seconds), and how many dates are kept
+_HOLIDAYS_CACHE_TTL = 6 * 60 * 60
+_HOLIDAYS_CACHE_SIZE = 32
+
+
+async def _get_holidays(bot: "latexbot.LatexBot", date: str) -> typing.Dict[str, typing.Any]:
+    """
+    Get the Checkiday data for a day, in the YYYY/MM/DD format.
+
+    Successful results are cached for a few hours, since they rarely change.
+    HTTP errors are returned as the "error" field, like errors from the API itself.
+    """
+    cached = bot.holidays_cache.get(date)
+    if cached is not None and time.monotonic() - cached[0] < _HOLIDAYS_CACHE_TTL:
+        return cached[1]
+    url = f"https://www.checkiday.com/api/3/?d={date}"
+    try:
+        async with bot.http_session.get(url) as resp:
+            if resp.status != 200:
+                logger.error(f"HTTP error while trying to get holidays: {resp}")
+                return {
+                    "error": f"HTTP error while trying to get holidays: {resp}",
+                }
+            data = await resp.json(loads=util.json_loads)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error while trying to get holidays: {e!r}")
+        return {
+            "error": f"Error while trying to get holidays: {e!r}",
+        }
+    if data.get("error") == "none":
+        bot.holidays_cache.pop(date, None)
+        if len(bot.holidays_cache) >= _HOLIDAYS_CACHE_SIZE:
+            # Evict the oldest entry
+            del bot.holidays_cache[next(iter(bot.holidays_cache))]
+        bot.holidays_cache[date] = (time.monotonic(), data)
+    return data
+
+
+async def _get_latest_xkcd(bot: "latexbot.LatexBot", now: datetime) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """
+    Get the latest xkcd, or None if today's comic has already been seen.
+    """
+    # There is at most one new comic per day
+    if bot.latest_xkcd_date == now.date():
+        return None
+    comic = await xkcd.get_comic(session=bot.http_session)
+    if comic is not None and (int(comic["year"]), int(comic["month"]), int(comic["day"])) == (now.year, now.month, now.day):
+        bot.latest_xkcd_date = now.date()
+    return comic
+
+
+async def _format_today_event(event: typing.Dict[str, typing.Any], now: datetime) -> str:
+    """
+    Format an event happening today as a line of the daily message, with its description if it has one.
+    """
+    start = Calendar.parse_time(event["start"])
+    # The event has a time, and it starts today (not already started)
+    if start.tzinfo and start > now:
+        line = f"# {event['summary']} today at *{start.strftime(util.TIME_DISPLAY_FORMAT)}*"
+    else:
+        # Otherwise format like normal
+        end = Calendar.parse_time(event["end"])
+        start_str = start.strftime(util.DATETIME_DISPLAY_FORMAT if start.tzinfo else util.DATE_DISPLAY_FORMAT)
+        end_str = end.strftime(util.DATETIME_DISPLAY_FORMAT if end.tzinfo else util.DATE_DISPLAY_FORMAT)
+        line = f"# {event['summary']} (*{start_str}* to *{end_str}*)"
+
+    # Add description if there is one
+    if event.get("description"):
+        line += _ZWSP_DESC_PREFIX + await _event_description_markdown(event)
+    return line
+
+
+async def _send_reddit_post(bot: "latexbot.LatexBot"):
+    """
+    Send the top post of the configured subreddit to the reddit chat.
+    """
+    logger.info(f"Checking r/{bot.config.subreddit}")
+    try:
+        post = await reddit.get_top_post_formatted(bot.config.subreddit, session=bot.http_session)
+        await bot.config.reddit_chat.send_message(post, creator=bot.msg_creator)
+        logger.info("Post found and sent")
+    except ValueError as e:
+        logger.error(f"No valid reddit post found: {e}")
+    except aiohttp.ClientResponseError as e:
+        logger.error(f"HTTP error: {e}")
+
+
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
 async def command_daily_message(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: pyryver.User, msg_id: str, args: str): # pylint: disable=unused-argument
     """
@@ -2665,19 +2926,27 @@ async def command_daily_message(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
     ---
     > `@latexbot dailyMessage` - Send the daily message.
     """
-    if bot.analytics:
+    if bot.analytics and bot.analytics.dirty:
         bot.save_analytics()
     await bot.update_cache()
     now = bot.current_time()
 
     logger.info("Starting daily message routine")
-    async with aiohttp.ClientSession() as session:
+    # Start the network requests now so they run while the calendar is checked
+    logger.info("Checking Checkiday and getting xkcd")
+    holidays_task = asyncio.ensure_future(_get_holidays(bot, now.strftime("%Y/%m/%d")))
+    xkcd_task = asyncio.ensure_future(_get_latest_xkcd(bot, now))
+    # Sends to different chats don't need to wait for each other
+    pending = [] # type: typing.List[asyncio.Future]
+    try:
         # Check calendar events
         if bot.config.calendar is not None:
             logger.info("Checking calendar events")
             for retries in range(5):
                 try:
-                    events = bot.config.calendar.get_today_events(now)
+                    # The Google API client is blocking, so run it in a thread to let the requests above proceed
+                    events = await asyncio.get_event_loop().run_in_executor(None, bot.config.calendar.get_today_events, now)
+                    break
                 except BrokenPipeError:
                     logger.exception(f"Broken pipe error! (Attempts: {retries + 1})")
                     # Re-raise if too many tries, so that the maintainer is notified
@@ -2685,68 +2954,60 @@ async def command_daily_message(bot: "latexbot.LatexBot", chat: pyryver.Chat, us
                         raise
                     await asyncio.sleep(5)
             if events:
-                resp = "Reminder: These events are happening today:"
-                for event in events:
-                    start = Calendar.parse_time(event["start"])
-                    end = Calendar.parse_time(event["end"])
-
-                    # The event has a time, and it starts today (not already started)
-                    if start.tzinfo and start > now:
-                        resp += f"\n# {event['summary']} today at *{start.strftime(util.TIME_DISPLAY_FORMAT)}*"
-                    else:
-                        # Otherwise format like normal
-                        start_str = start.strftime(util.DATETIME_DISPLAY_FORMAT if start.tzinfo else util.DATE_DISPLAY_FORMAT)
-                        end_str = end.strftime(util.DATETIME_DISPLAY_FORMAT if end.tzinfo else util.DATE_DISPLAY_FORMAT)
-                        resp += f"\n# {event['summary']} (*{start_str}* to *{end_str}*)"
-
-                    # Add description if there is one
-                    if "description" in event and event["description"] != "":
-                        # Note: The U+200B (Zero-Width Space) is so that Ryver won't turn ): into a sad face emoji
-                        resp += f"\u200B:\n{markdownify(event['description'])}"
-                await bot.config.announcements_chat.send_message(resp, bot.msg_creator)
-        # Checkiday
-        logger.info("Checking Checkiday")
-        url = f"https://www.checkiday.com/api/3/?d={now.strftime('%Y/%m/%d')}"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                logger.error(f"HTTP error while trying to get holidays: {resp}")
-                data = {
-                    "error": f"HTTP error while trying to get holidays: {resp}",
-                }
-            else:
-                data = await resp.json()
-        if data["error"] != "none":
-            await bot.config.messages_chat.send_message(f"Error while trying to check today's holidays: {data['error']}", bot.msg_creator)
-        else:
-            if data.get("holidays", None):
-                msg = "Here is a list of all the holidays today:\n"
-                msg += "\n".join(f"* [{holiday['name']}]({holiday['url']})" for holiday in data["holidays"])
-                await bot.config.messages_chat.send_message(msg, bot.msg_creator)
-        # xkcd
-        logger.info("Getting xkcd")
-        comic = await xkcd.get_comic(session=session)
-        if comic['num'] <= bot.config.last_xkcd:
-            logger.info(f"No new xkcd found (latest is {comic['num']}).")
-        else:
-            logger.info(f"New comic found! (#{comic['num']})")
-            xkcd_creator = pyryver.Creator(bot.msg_creator.name, util.XKCD_PROFILE)
-            await bot.config.messages_chat.send_message(f"New xkcd!\n\n{xkcd.comic_to_str(comic)}", xkcd_creator)
-            # Update xkcd number
-            bot.config.last_xkcd = comic['num']
-            bot.save_config()
-        # Reddit
-        if bot.config.reddit_chat is not None and bot.config.subreddit is not None:
-            logger.info(f"Checking r/{bot.config.subreddit}")
-            try:
-                post = await reddit.get_top_post_formatted(bot.config.subreddit, session=session)
-                await bot.config.reddit_chat.send_message(post, creator=bot.msg_creator)
-                logger.info("Post found and sent")
-            except ValueError as e:
-                logger.error(f"No valid reddit post found: {e}")
-            except aiohttp.ClientResponseError as e:
-                logger.error(f"HTTP error: {e}")
-        # Tips
-        await bot.config.messages_chat.send_message(f"Random latexbot tip of the day: {generate_random_tip(bot)}", bot.msg_creator)
+                lines = []
+                for i, event in enumerate(events):
+                    # Let other tasks (e.g. the live session) run once in a while if there are lots of events
+                    if i and i % 25 == 0:
+                        await asyncio.sleep(0)
+                    lines.append(await _format_today_event(event, now))
+                announcement = bot.config.announcements_chat.send_message("Reminder: These events are happening today:\n" + "\n".join(lines), bot.msg_creator)
+                # Keep the messages in order if they go to the same chat
+                if bot.config.announcements_chat is bot.config.messages_chat:
+                    await announcement
+                else:
+                    pending.append(asyncio.ensure_future(announcement))
+        data, comic = await asyncio.gather(holidays_task, xkcd_task, return_exceptions=True)
+    finally:
+        # Don't leave the requests running or their errors unretrieved if checking the calendar failed
+        # (Both are no-ops if the requests were already gathered above)
+        holidays_task.cancel()
+        xkcd_task.cancel()
+        await asyncio.gather(holidays_task, xkcd_task, return_exceptions=True)
+    # Checkiday
+    if isinstance(data, Exception):
+        logger.error(f"Error while trying to get holidays: {data}")
+        data = {
+            "error": f"Error while trying to get holidays: {data}",
+        }
+    send = bot.config.messages_chat.send_message
+    if data.get("error", "none") != "none":
+        await send(f"Error while trying to check today's holidays: {data['error']}", bot.msg_creator)
+    else:
+        holidays = data.get("holidays")
+        if holidays:
+            await send(_format_holidays("Here is a list of all the holidays today:", holidays), bot.msg_creator)
+    # xkcd
+    if isinstance(comic, Exception):
+        logger.error(f"Error while trying to get xkcd: {comic}")
+    elif comic is None:
+        logger.info("No new xkcd found (today's comic has already been checked).")
+    elif comic['num'] <= bot.config.last_xkcd:
+        logger.info(f"No new xkcd found (latest is {comic['num']}).")
+    else:
+        logger.info(f"New comic found! (#{comic['num']})")
+        xkcd_creator = pyryver.Creator(bot.msg_creator.name, util.XKCD_PROFILE)
+        await send(f"New xkcd!\n\n{xkcd.comic_to_str(comic)}", xkcd_creator)
+        # Update xkcd number
+        bot.config.last_xkcd = comic['num']
+        bot.schedule_save_config()
+    # Reddit
+    if bot.config.reddit_chat is not None and bot.config.subreddit is not None:
+        pending.append(asyncio.ensure_future(_send_reddit_post(bot)))
+    # Tips
+    await send(f"Random latexbot tip of the day: {generate_random_tip(bot)}", bot.msg_creator)
+    for result in await asyncio.gather(*pending, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error(f"Error while sending the daily message: {result}")
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -2790,7 +3051,7 @@ async def command_link_git_hub(bot: "latexbot.LatexBot", chat: pyryver.Chat, use
             raise CommandError(f"GitHub username `{gh}` has no associated Ryver username.")
         del bot.config.gh_users_map[gh]
         await chat.send_message(f"GitHub username `{gh}`'s association has been removed.", bot.msg_creator)
-    bot.save_config()
+    bot.schedule_save_config()
 
 
 @command(access_level=Command.ACCESS_LEVEL_ORG_ADMIN)
@@ -2802,14 +3063,11 @@ async def command_message(bot: "latexbot.LatexBot", chat: pyryver.Chat, user: py
     syntax: [(name|nickname|id|jid)=][+]<forum|team> <message>
     hidden: true
     """
+    chat_name, sep, msg = args.partition(" ")
+    if not sep:
+        raise CommandError("Invalid syntax.")
     try:
-        i = args.index(" ")
-    except ValueError as e:
-        raise CommandError("Invalid syntax.") from e
-    chat_name = args[:i]
-    msg = args[i + 1:]
-    try:
-        to = util.parse_chat_name(bot.ryver, chat_name)
+        to = bot.find_chat(chat_name)
     except ValueError as e:
         raise CommandError(str(e)) from e
     if to is None:
@@ -1,8 +1,10 @@
 import dateutil.parser
+import functools
 import typing
 from datetime import datetime, timedelta
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
+from . import util
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.events']
 
@@ -60,9 +62,59 @@ class Calendar:
         self.service.events().delete(calendarId=self.cal_id, eventId=event_id).execute()
 
 
+    @staticmethod
+    def make_all_day_event(summary: str, start: datetime, end: datetime, description: str = None) -> typing.Dict:
+        """
+        Make the body of an all-day event for use with add_event().
+        """
+        event = {
+            "summary": summary,
+            "start": {"date": start.strftime(util.CALENDAR_DATE_FORMAT)},
+            "end": {"date": end.strftime(util.CALENDAR_DATE_FORMAT)},
+        }
+        if description:
+            event["description"] = description
+        return event
+
+    @staticmethod
+    def make_timed_event(summary: str, start: datetime, end: datetime, tz_str: str, description: str = None) -> typing.Dict:
+        """
+        Make the body of an event with start and end times for use with add_event().
+        """
+        event = {
+            "summary": summary,
+            "start": {"dateTime": start.isoformat(), "timeZone": tz_str},
+            "end": {"dateTime": end.isoformat(), "timeZone": tz_str},
+        }
+        if description:
+            event["description"] = description
+        return event
+
     @staticmethod
     def parse_time(t: typing.Dict) -> datetime:
         if "date" in t:
-            return datetime.strptime(t["date"], "%Y-%m-%d")
+            return _parse_date(t["date"])
         else:
-            return dateutil.parser.parse(t["dateTime"])
+            return _parse_datetime(t["dateTime"])
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_date(s: str) -> datetime:
+    """
+    Parse an all-day event date.
+    """
+    return datetime.strptime(s, util.CALENDAR_DATE_FORMAT)
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_datetime(s: str) -> datetime:
+    """
+    Parse an event date time.
+
+    Google Calendar returns RFC 3339 timestamps, which fromisoformat() can parse much faster
+    than dateutil once the Z suffix is replaced. dateutil is used for anything else.
+    """
+    try:
+        return datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+    except ValueError:
+        return dateutil.parser.parse(s)
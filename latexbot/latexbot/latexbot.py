@@ -5,10 +5,12 @@ This module contains the main LatexBot class.
 import aiohttp
 import asyncio
 import atexit
+import concurrent.futures.process
 import datetime
 import json
 import logging
 import marshmallow
+import multiprocessing
 import os
 import pyryver
 import random
@@ -18,7 +20,7 @@ import time
 import typing # pylint: disable=unused-import
 from dataclasses import dataclass
 from traceback import format_exc
-from . import analytics, commands, schemas, server, trivia, util
+from . import analytics, commands, schemas, server, simplelatex, trivia, util
 from .aho_corasick import Automaton
 from .cid import CaseInsensitiveDict
 from .command import Command, CommandSet, CommandError
@@ -37,13 +39,27 @@ class UserInfo:
     avatar: typing.Optional[str] = None
     presence: typing.Optional[str] = None
     last_activity: float = 0
-    muted: typing.Optional[typing.Dict[int, asyncio.Task]] = None
+    muted: typing.Optional[typing.Dict[int, typing.Optional[asyncio.TimerHandle]]] = None
 
 
 # Global LatexBot instance
 bot = None # type: LatexBot
 
 
+def _worker_main(conn: "multiprocessing.connection.Connection", func: typing.Callable, args: tuple) -> None:
+    """
+    Entry point of the worker processes started by LatexBot.run_in_worker().
+
+    Sends back a tuple of (whether the call succeeded, result or exception).
+    """
+    try:
+        result = (True, func(*args))
+    except Exception as e: # pylint: disable=broad-except
+        result = (False, e)
+    conn.send(result)
+    conn.close()
+
+
 class LatexBot:
     """
     An instance of LaTeX Bot.
@@ -56,9 +72,15 @@ class LatexBot:
         else:
             self.version = version
         self.enabled = True
+        self.wakeup_handle = None # type: asyncio.TimerHandle
 
         self.ryver = None # type: pyryver.Ryver
         self.session = None # type: pyryver.RyverWS
+        # Shared HTTP session for outside APIs, created in init()
+        self.http_session = None # type: aiohttp.ClientSession
+        # Worker processes for CPU-bound work (simple expression parsing), set up in init()
+        self.cpu_context = None # type: multiprocessing.context.ForkServerContext
+        self.cpu_semaphore = None # type: asyncio.Semaphore
         self.username = None # type: str
         self.user = None # type: pyryver.User
         self.user_info = {} # type: typing.Dict[int, UserInfo]
@@ -74,19 +96,28 @@ class LatexBot:
 
         self.trivia_file = None # type: str
         self.trivia_games = {} # type: typing.Dict[int, trivia.LatexBotTriviaGame]
+        # Ongoing trivia games by the ID of their current question message
+        self.trivia_question_msgs = {} # type: typing.Dict[str, trivia.LatexBotTriviaGame]
 
         self.analytics_file = None # type: str
         self.analytics = None # type: analytics.Analytics
 
         self.watch_file = None # type: str
         self.keyword_watches = None # type: typing.Dict[int, schemas.KeywordWatch]
+        # None when out of date; use get_automaton() to get an up-to-date one
         self.keyword_watches_automaton = None # type: Automaton
 
         self.daily_msg_task = None # type: typing.Awaitable
 
         self.commands = None # type: CommandSet
+        # Access levels of (chat ID, user ID), cleared for every message
+        self.access_level_cache = {} # type: typing.Dict[typing.Tuple[int, int], int]
+        # Results of util.parse_chat_name(), cleared when the chat data is updated
+        self.chat_name_cache = {} # type: typing.Dict[str, pyryver.Chat]
         self.help = None # typing.Dict[str, typing.List[typing.Tuple[str, str]]]
         self.command_help = {} # type: typing.Dict[str, str]
+        # Extended help text and command, by lowercase command name
+        self.help_index = {} # type: typing.Dict[str, typing.Tuple[str, Command]]
 
         self.msg_creator = pyryver.Creator("LaTeX Bot " + self.version)
 
@@ -98,6 +129,17 @@ class LatexBot:
 
         self.recently_sent_tips = [] # type: typing.List[int]
 
+        # Simple expression conversions by expression, in least to most recently used order
+        self.simple_latex_cache = {} # type: typing.Dict[str, str]
+        # Checkiday results by date, with the time they were fetched
+        self.holidays_cache = {} # type: typing.Dict[str, typing.Tuple[float, typing.Dict[str, typing.Any]]]
+        # Set when the latest xkcd was posted today, so there can't be a newer one until tomorrow
+        self.latest_xkcd_date = None # type: datetime.date
+
+        self._background_tasks = set() # type: typing.Set[asyncio.Future]
+        self._pending_save = None # type: asyncio.Future
+        self._pending_watches_save = None # type: asyncio.Future
+
         global bot # pylint: disable=global-statement
         bot = self
 
@@ -128,6 +170,15 @@ class LatexBot:
         self.username = user
         cache = pyryver.FileCacheStorage(cache_dir, cache_prefix)
         self.ryver = pyryver.Ryver(org=org, user=user, password=password, cache=cache)
+        self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10, connect=3),
+                                                  connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300))
+        # Forking a process that's running an event loop and other threads isn't safe, so use a forkserver
+        self.cpu_context = multiprocessing.get_context("forkserver")
+        # Import the parser once in the forkserver instead of in every worker
+        self.cpu_context.set_forkserver_preload(["latexbot.simplelatex"])
+        self.cpu_semaphore = asyncio.Semaphore(self._MAX_WORKERS)
+        # Start up the forkserver now instead of on the first command
+        self.run_in_background(self.run_in_worker(simplelatex.str_to_latex_picklable, "x", timeout=60.0))
         await self.ryver.load_missing_chats()
         self.user = self.ryver.get_user(username=self.username)
         self.maintainer = self.ryver.get_user(id=int(os.environ.get("LATEXBOT_MAINTAINER_ID", 0)))
@@ -205,7 +256,7 @@ class LatexBot:
 
         # Load config
         try:
-            with open(config_file, "r") as f:
+            with open(config_file, "r", encoding="utf-8") as f:
                 err = await self.load_config(json.load(f))
             if err:
                 logger.error(err)
@@ -218,9 +269,12 @@ class LatexBot:
                 await self.maintainer.send_message(msg, self.msg_creator)
             await self.load_config({})
 
+        # Make sure scheduled config saves aren't lost on exit
+        atexit.register(self.flush_save_config)
+
         # Load watches
         try:
-            with open(watch_file, "r") as f:
+            with open(watch_file, "r", encoding="utf-8") as f:
                 err = await self.load_watches(json.load(f))
             if err:
                 logger.error(err)
@@ -233,6 +287,9 @@ class LatexBot:
                 await self.maintainer.send_message(msg, self.msg_creator)
             await self.load_watches({})
 
+        # Make sure scheduled watch saves aren't lost on exit
+        atexit.register(self.flush_save_watches)
+
         # Load roles
         try:
             with open(roles_file, "r") as f:
@@ -277,7 +334,7 @@ class LatexBot:
         # Load trivia
         try:
             with open(trivia_file, "r") as f:
-                trivia.set_custom_trivia_questions(json.load(f))
+                trivia.set_custom_trivia_questions(util.json_loads(f.read()))
         except (json.JSONDecodeError, FileNotFoundError) as e:
             logger.error(f"Error while loading custom trivia questions: {e}.")
             if self.maintainer is not None:
@@ -286,16 +343,48 @@ class LatexBot:
     def save_config(self) -> None:
         """
         Save the current config to the config JSON.
+
+        This also cancels any save scheduled with schedule_save_config(), since the
+        config written here is already up to date.
+        """
+        if self._pending_save is not None:
+            self._pending_save.cancel()
+            self._pending_save = None
+        util.write_file_atomic(self.config_file, util.json_dumps(schemas.config.dump(self.config)))
+
+    def schedule_save_config(self, delay: float = 0.5) -> None:
+        """
+        Save the config after a short delay.
+
+        Calling this again before the config is saved restarts the delay, so a burst of
+        changes only results in a single write.
+        """
+        if self._pending_save is not None:
+            self._pending_save.cancel()
+        self._pending_save = asyncio.ensure_future(self._delayed_save_config(delay))
+
+    async def _delayed_save_config(self, delay: float) -> None:
         """
-        with open(self.config_file, "w") as f:
-            f.write(schemas.config.dumps(self.config))
+        A task that saves the config after a delay.
+        """
+        await asyncio.sleep(delay)
+        # Clear it first so save_config() doesn't cancel this task
+        self._pending_save = None
+        self.save_config()
+
+    def flush_save_config(self) -> None:
+        """
+        Immediately save the config if a save is scheduled.
+        """
+        if self._pending_save is not None:
+            self.save_config()
 
     def save_roles(self) -> None:
         """
         Save the current roles to the roles JSON.
         """
         with open(self.roles_file, "w") as f:
-            json.dump(self.roles.to_dict(), f)
+            json.dump(self.roles, f)
 
     def save_analytics(self) -> None:
         """
@@ -303,20 +392,53 @@ class LatexBot:
         """
         with open(self.analytics_file, "w") as f:
             f.write(self.analytics.dumps())
+        self.analytics.dirty = False
 
     def save_watches(self) -> None:
         """
         Save the current keyword watches to the watches JSON.
+
+        This also cancels any save scheduled with schedule_save_watches().
         """
+        if self._pending_watches_save is not None:
+            self._pending_watches_save.cancel()
+            self._pending_watches_save = None
         data = {str(user): schemas.keyword_watch.dump(watches) for user, watches in self.keyword_watches.items()}
-        with open(self.watch_file, "w") as f:
-            json.dump(data, f)
+        util.write_file_atomic(self.watch_file, util.json_dumps(data))
+
+    def schedule_save_watches(self, delay: float = 0.5) -> None:
+        """
+        Save the keyword watches after a short delay.
+
+        Calling this again before the watches are saved restarts the delay, so a burst of
+        changes only results in a single write.
+        """
+        if self._pending_watches_save is not None:
+            self._pending_watches_save.cancel()
+        self._pending_watches_save = asyncio.ensure_future(self._delayed_save_watches(delay))
+
+    async def _delayed_save_watches(self, delay: float) -> None:
+        """
+        A task that saves the keyword watches after a delay.
+        """
+        await asyncio.sleep(delay)
+        # Clear it first so save_watches() doesn't cancel this task
+        self._pending_watches_save = None
+        self.save_watches()
+
+    def flush_save_watches(self) -> None:
+        """
+        Immediately save the keyword watches if a save is scheduled.
+        """
+        if self._pending_watches_save is not None:
+            self.save_watches()
 
     def update_help(self) -> None:
         """
         Re-generate the help text.
         """
         self.help, self.command_help = self.commands.generate_help_text(self.ryver)
+        self.help_index = {name.lower(): (text, self.commands.commands[name]) for name, text in self.command_help.items()}
 
     async def _daily_msg(self, init_delay: float = 0):
         """
@@ -352,8 +474,9 @@ class LatexBot:
         now = self.current_time()
         # Get that time, today
         t = datetime.datetime.combine(now, self.config.daily_message_time, tzinfo=self.config.tzinfo)
-        # If already passed, get that time the next day
-        if t < now:
+        # If already passed (or happening right now), get that time the next day
+        # This way a reschedule right after the message is sent can never fire it twice
+        if t <= now:
             t += datetime.timedelta(days=1)
         init_delay = (t - now).total_seconds()
         self.daily_msg_task = asyncio.create_task(self._daily_msg(init_delay))
@@ -365,6 +488,9 @@ class LatexBot:
         """
         old_users = set(user.get_id() for user in self.ryver.users)
         await self.ryver.load_chats()
+        self.chat_name_cache.clear()
+        # Formatted access rules contain usernames, which may have changed
+        self.config.access_rules_render_cache.clear()
         # Get user avatar URLs
         # This information is not included in the regular user info
         info = await self.ryver.get_info()
@@ -386,22 +512,42 @@ class LatexBot:
         dfa = Automaton()
         keywords = {}
         # Gather up all the keywords
+        # The automaton searches the lowercased message, so keywords that only differ in case
+        # must share an entry
         for user, watches in self.keyword_watches.items():
             if not watches.on:
                 continue
             for keyword in watches.keywords:
-                if keyword.keyword not in keywords:
-                    keywords[keyword.keyword] = []
-                # Each keyword has a list of users and whether it should match case and whole words
-                keywords[keyword.keyword].append((user, keyword.match_case, keyword.whole_word))
+                # Each keyword has a list of users, the keyword as they typed it and
+                # whether it should match case and whole words
+                keywords.setdefault(keyword.keyword.lower(), []).append((user, keyword.keyword, keyword.match_case, keyword.whole_word))
         for k, v in keywords.items():
-            dfa.add_str(k.lower(), (k, v))
+            dfa.add_str(k, v)
         dfa.build_automaton()
         self.keyword_watches_automaton = dfa
 
-    async def get_replace_message_creator(self, msg: pyryver.Message) -> pyryver.Creator:
+    def invalidate_automaton(self) -> None:
+        """
+        Mark the keyword searching DFA as out of date after the keyword watches change.
+
+        It is rebuilt the next time it is needed, so several changes only cause one rebuild.
+        """
+        self.keyword_watches_automaton = None
+
+    def get_automaton(self) -> Automaton:
+        """
+        Get the DFA used for keyword searching, rebuilding it if it is out of date.
+        """
+        if self.keyword_watches_automaton is None:
+            self.rebuild_automaton()
+        return self.keyword_watches_automaton
+
+    async def get_replace_message_creator(self, msg: pyryver.Message, authors: typing.Dict[int, pyryver.User] = None) -> pyryver.Creator:
         """
         Get the Creator object that can be used for replacing a message.
+
+        Optionally, a dict of prefetched authors by ID can be provided, which is used before
+        making a request for an author that isn't in the cache.
         """
         # Get the creator
         msg_creator = msg.get_creator()
@@ -409,12 +555,74 @@ class LatexBot:
         if not msg_creator:
             # First attempt to search for the ID in the list
             # if that fails then get it directly using a request
-            msg_author = self.ryver.get_user(id=msg.get_author_id()) or (await msg.get_author())
+            msg_author = self.ryver.get_user(id=msg.get_author_id())
+            if msg_author is None:
+                msg_author = (authors or {}).get(msg.get_author_id()) or (await msg.get_author())
             info = self.user_info.get(msg_author.get_id())
             avatar = "" if info is None or info.avatar is None else info.avatar
             msg_creator = pyryver.Creator(msg_author.get_name(), avatar)
         return msg_creator
 
+    def send_in_background(self, chat: pyryver.Chat, message: str) -> None:
+        """
+        Send a message as LaTeX Bot without waiting for it to be sent.
+
+        The task is kept until it is done so that it won't be garbage collected,
+        and any errors are logged.
+        """
+        self.run_in_background(chat.send_message(message, self.msg_creator))
+
+    # Each worker is a full import of latexbot, so limit how many can run at once
+    _MAX_WORKERS = 2
+
+    async def run_in_worker(self, func: typing.Callable, *args, timeout: float) -> typing.Any:
+        """
+        Run a picklable function in a new worker process and return its result.
+
+        Every call gets its own process, so a job that times out is killed without
+        affecting any others. Exceptions raised by the function are re-raised here.
+        Raises asyncio.TimeoutError if the job times out, or BrokenProcessPool if the
+        worker exits without a result.
+        """
+        loop = asyncio.get_event_loop()
+        async with self.cpu_semaphore:
+            recv_conn, send_conn = self.cpu_context.Pipe(duplex=False)
+            process = self.cpu_context.Process(target=_worker_main, args=(send_conn, func, args), daemon=True)
+            process.start()
+            # Only the worker should hold the sending end, so that recv() fails if it dies
+            send_conn.close()
+            try:
+                success, result = await asyncio.wait_for(loop.run_in_executor(None, recv_conn.recv), timeout)
+            except EOFError as e:
+                raise concurrent.futures.process.BrokenProcessPool("Worker process exited without a result") from e
+            finally:
+                # This also unblocks the recv() if the job timed out
+                if process.is_alive():
+                    process.terminate()
+                await loop.run_in_executor(None, process.join)
+        if not success:
+            raise result
+        return result
+
+    def run_in_background(self, coro: typing.Awaitable) -> None:
+        """
+        Run a coroutine without waiting for it to finish.
+
+        The task is kept until it is done so that it won't be garbage collected,
+        and any errors are logged.
+        """
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, task: asyncio.Future) -> None:
+        """
+        Done callback for tasks started with run_in_background().
+        """
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error in background task: {task.exception()!r}")
+
     def preprocess_command(self, command: str, is_dm: bool) -> typing.Optional[typing.Tuple[str, str]]:
         """
         Preprocess a command.
@@ -461,20 +669,32 @@ class LatexBot:
 
             # Expand aliases
             command = None
-            for alias in self.config.aliases:
-                if alias.from_ == cmd:
-                    # Check for recursion
-                    if alias.from_ in used_aliases:
-                        raise ValueError(f"Recursive alias: '{alias.from_}'!")
-                    used_aliases.add(alias.from_)
-                    # Expand the alias
-                    command = alias.to + space_char + args
-                    break
+            to = self.config.aliases.get(cmd)
+            if to is not None:
+                # Check for recursion
+                if cmd in used_aliases:
+                    raise ValueError(f"Recursive alias: '{cmd}'!")
+                used_aliases.add(cmd)
+                # Expand the alias
+                command = to + space_char + args
             # No aliases were expanded - return
             if not command:
                 return (cmd.strip(), args.strip())
             # Otherwise go again until no more expansion happens
 
+    def find_chat(self, name: str) -> pyryver.Chat:
+        """
+        Look up a chat with util.parse_chat_name(), caching the results until the next cache update.
+
+        Chats that are not found are not cached.
+        """
+        chat = self.chat_name_cache.get(name)
+        if chat is None:
+            chat = util.parse_chat_name(self.ryver, name)
+            if chat is not None:
+                self.chat_name_cache[name] = chat
+        return chat
+
     def current_time(self) -> datetime.datetime:
         """
         Get the current time in the organization's timezone.
@@ -540,6 +760,8 @@ class LatexBot:
                 # Ignore messages sent by us
                 if from_user.get_username() == self.username:
                     return
+                # Access levels may have changed since the last message
+                self.access_level_cache.clear()
 
                 # Record activity
                 if from_user.get_id() not in self.user_info:
@@ -604,6 +826,10 @@ class LatexBot:
                         await session.send_presence_change(pyryver.RyverWS.PRESENCE_AVAILABLE)
                         if not self.enabled:
                             self.enabled = True
+                            # Cancel the scheduled wake up if put to sleep
+                            if self.wakeup_handle is not None:
+                                self.wakeup_handle.cancel()
+                                self.wakeup_handle = None
                             logger.info(f"Re-enabled by user {from_user.get_name()}!")
                             await to.send_message("I have been re-enabled!", self.msg_creator)
                         else:
@@ -690,18 +916,12 @@ class LatexBot:
 
                     # Search for keyword matches
                     notify_users = dict() # type: typing.Dict[int, typing.Set[str]]
-                    for i, (keyword, users) in self.keyword_watches_automaton.find_all(msg.text.lower()):
-                        for user, match_case, whole_word in users:
+                    for i, watchers in self.get_automaton().find_all(msg.text.lower()):
+                        for user, keyword, match_case, whole_word in watchers:
                             # Verify case matching
-                            if match_case:
-                                err = False
-                                for j, c in enumerate(keyword):
-                                    # Aho-Corasick returns rightmost char index
-                                    if msg.text[i - len(keyword) + 1 + j] != c:
-                                        err = True
-                                        break
-                                if err:
-                                    continue
+                            # Aho-Corasick returns rightmost char index
+                            if match_case and msg.text[i - len(keyword) + 1:i + 1] != keyword:
+                                continue
                             # Verify whole words
                             if whole_word:
                                 # Check right boundary
@@ -779,5 +999,19 @@ class LatexBot:
         """
         Stop running LaTeX Bot.
         """
+        self.flush_save_config()
+        self.flush_save_watches()
+        # Let any background tasks (e.g. messages still being sent) finish, but don't wait forever
+        if self._background_tasks:
+            _, pending = await asyncio.wait(self._background_tasks, timeout=10)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} background task(s) that didn't finish in time")
+                await asyncio.gather(*pending, return_exceptions=True)
         await self.webhook_server.stop()
+        if self.http_session is not None:
+            await self.http_session.close()
+        if self.tba is not None:
+            await self.tba.close()
         await self.session.terminate()
@@ -1,5 +1,6 @@
 import aiohttp
 import base64
+from . import util
 
 async def render(eqn: str, **kwargs) -> bytes:
     """
@@ -9,7 +10,8 @@ async def render(eqn: str, **kwargs) -> bytes:
     """
     kwargs["source"] = eqn
     async with aiohttp.request("POST", "http://tex-slave/render", json=kwargs) as resp:
-        result = await resp.json()
+        # Parse the raw body directly instead of decoding it into a str first
+        result = util.json_loads(await resp.read())
     if result["status"] != "ok":
         if "internal_error" in result:
             raise ValueError(f"Internal error: `{result['internal_error']}`")
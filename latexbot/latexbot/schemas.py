@@ -37,29 +37,27 @@ class ChatField(fields.Field):
             raise ValidationError("Invalid chat or chat not found") from e
 
 
-class Alias:
+class AliasesField(fields.Field):
     """
-    An alias.
-    """
-
-    __slots__ = ("from_", "to")
-
-    def __init__(self, from_: str, to: str):
-        self.from_ = from_
-        self.to = to
-
+    A field containing all the aliases as a dict of alias name to expansion.
 
-class AliasSchema(Schema):
-    """
-    Schema for an Alias object.
+    The field will be serialized and deserialized as a list of objects in the form
+    {"from": <name>, "to": <expansion>}, in the order they were created.
     """
 
-    from_ = fields.Str(required=True, data_key="from")
-    to = fields.Str(required=True)
+    def _serialize(self, value: typing.Dict[str, str], attr: str, obj: typing.Any, **kwargs): # pylint: disable=unused-argument
+        return [{"from": k, "to": v} for k, v in value.items()]
 
-    @decorators.post_load
-    def make_obj(self, data, **kwargs): # pylint: disable=unused-argument, no-self-use, missing-function-docstring
-        return Alias(**data)
+    def _deserialize(self, value: typing.List[typing.Dict[str, str]], attr: str, data: typing.Any, **kwargs): # pylint: disable=unused-argument
+        if not isinstance(value, list):
+            raise ValidationError("Not a valid list.")
+        aliases = {}
+        for alias in value:
+            if not isinstance(alias, dict) or not isinstance(alias.get("from"), str) or not isinstance(alias.get("to"), str):
+                raise ValidationError("Invalid alias: each alias must have a from and to string.")
+            # Old configs may have duplicate aliases, in which case the first one was always used
+            aliases.setdefault(alias["from"], alias["to"])
+        return aliases
 
 
 class AccessRule:
@@ -150,14 +148,14 @@ class Config:
                  "gh_updates_chat", "gh_issues_chat", "gh_users_map",
                  "calendar_id", "daily_message_time", "last_xkcd", "subreddit",
                  "aliases", "access_rules", "macros", "opinions", "command_prefixes",
-                 "tzinfo", "calendar", "read_only_chats")
+                 "tzinfo", "calendar", "read_only_chats", "access_rules_render_cache", "opinions_index")
 
     def __init__(self, admins: typing.List[int], tz_str: str, frc_team: int, welcome_message: str, #NOSONAR
                  access_denied_messages: typing.List[str], wdyt_yes_messages: typing.List[str],
                  wdyt_no_messages: typing.List[str], home_chat: pyryver.Chat, announcements_chat: pyryver.Chat,
                  messages_chat: pyryver.Chat, reddit_chat: pyryver.Chat, gh_updates_chat: pyryver.Chat,
                  gh_issues_chat: pyryver.Chat, gh_users_map: typing.Dict[str, str], calendar_id: str,
-                 daily_message_time: datetime.time, last_xkcd: int, subreddit: str, aliases: typing.List[Alias],
+                 daily_message_time: datetime.time, last_xkcd: int, subreddit: str, aliases: typing.Dict[str, str],
                  access_rules: typing.Dict[str, AccessRule], macros: typing.Dict[str, str],
                  opinions: typing.List[Opinion], command_prefixes: typing.List[str],
                  read_only_chats: typing.Dict[pyryver.Chat, typing.List[str]]):
@@ -187,6 +185,13 @@ class Config:
         self.read_only_chats = read_only_chats
         # Fields not directly loaded from JSON
         self.tzinfo = dateutil.tz.gettz(self.tz_str)
+        # Formatted access rules for each command; entries must be removed when the rules change
+        self.access_rules_render_cache = {} # type: typing.Dict[str, str]
+        # Opinions for each thing, in the order they're configured
+        self.opinions_index = {} # type: typing.Dict[str, typing.List[Opinion]]
+        for opinion in self.opinions:
+            for thing in opinion.thing:
+                self.opinions_index.setdefault(thing, []).append(opinion)
         # Handle the case of an empty env var
         cal_cred = os.environ.get("LATEXBOT_CALENDAR_CREDENTIALS") or "calendar_credentials.json"
         if not os.path.exists(cal_cred):
@@ -223,7 +228,7 @@ class ConfigSchema(Schema):
     last_xkcd = fields.Int(missing=0, data_key="lastXKCD")
     subreddit = fields.Str(missing=None, allow_none=True)
     # Advanced config
-    aliases = fields.List(fields.Nested(AliasSchema), missing=[])
+    aliases = AliasesField(missing=dict)
     access_rules = fields.Dict(fields.Str(), fields.Nested(AccessRuleSchema), missing={}, data_key="accessRules")
     macros = fields.Dict(fields.Str(), fields.Str(), missing={})
     opinions = fields.List(fields.Nested(OpinionSchema), missing=[])
@@ -329,7 +329,7 @@ class Server:
             with open(self.bot.roles_file, "r") as f:
                 return web.Response(text=f.read(), status=200, content_type="application/json")
         except FileNotFoundError:
-            return web.json_response(self.bot.roles.to_dict(), status=200)
+            return web.json_response(self.bot.roles, status=200)
 
     @basicauth("read", "Custom Trivia Questions")
     async def _trivia_handler(self, req: web.Request): # pylint: disable=unused-argument
@@ -340,7 +340,7 @@ class Server:
             with open(self.bot.trivia_file, "r") as f:
                 return web.Response(text=f.read(), status=200, content_type="application/json")
         except FileNotFoundError:
-            return web.json_response(trivia.CUSTOM_TRIVIA_QUESTIONS, status=200)
+            return web.json_response(trivia.CUSTOM_TRIVIA_QUESTIONS, status=200, dumps=util.json_dumps)
 
     @basicauth("read", "Keyword Watches")
     async def _keyword_watches_handler(self, req: web.Request): # pylint: disable=unused-argument
@@ -348,7 +348,7 @@ class Server:
         Handle a GET request to /keyword_watches.
         """
         try:
-            with open(self.bot.watch_file, "r") as f:
+            with open(self.bot.watch_file, "r", encoding="utf-8") as f:
                 return web.Response(text=f.read(), status=200, content_type="application/json")
         except FileNotFoundError:
             return web.json_response(self.bot.keyword_watches, status=200)
@@ -371,7 +371,7 @@ class Server:
         if "chat" not in args or "message" not in args:
             return web.Response(body="Missing param", status=400)
         try:
-            chat = util.parse_chat_name(self.bot.ryver, args["chat"])
+            chat = self.bot.find_chat(args["chat"])
         except ValueError as e:
             return web.Response(body=str(e), status=400)
 
@@ -238,6 +238,26 @@ def tree_to_latex(expr: typing.Union[lark.Tree, lark.Token]) -> str:
     return TREE_PROCESSORS[expr.data](expr)
 
 
+class ParseError(Exception):
+    """
+    Raised by str_to_latex_picklable() when an expression could not be parsed.
+
+    Unlike lark's exceptions, this can be pickled, so it can be sent back from another process.
+    """
+
+
+def str_to_latex_picklable(expr: str) -> str:
+    """
+    Same as str_to_latex(), but raises ParseError instead of lark's exceptions.
+
+    This is used when converting expressions in a process pool.
+    """
+    try:
+        return str_to_latex(expr)
+    except lark.LarkError as e:
+        raise ParseError(str(e)) from None
+
+
 def str_to_latex(expr: str) -> str:
     r"""
     Convert simple, easy-to-read math expressions into LaTeX.
@@ -296,8 +316,14 @@ def str_to_latex(expr: str) -> str:
     To insert LaTeX directly into the output, surround it with $, e.g. `$\vec{v}$`.
     To insert a single LaTeX command directly into the output, enter it directly with the backslash,
     e.g. `sin\theta`.
+
+    Results are cached, since parsing can be slow for expressions with many interpretations.
     """
     return tree_to_latex(parser.parse(expr))
 
 
+# This has to be an Earley parser, since the grammar is ambiguous and relies on Earley to resolve it.
+# An LALR parser resolves these conflicts differently (e.g. int_0^inf would get a single bound of 0^inf,
+# and cbrt x' would become cbrt(x')) and can't handle absolute value bars at all, so it would change
+# the output for many expressions.
 parser = lark.Lark(GRAMMAR, start="start", parser="earley", lexer="standard", maybe_placeholders=True)
@@ -23,7 +23,10 @@ class TheBlueAlliance:
         headers = {
             "X-TBA-Auth-Key": read_key
         }
-        self._session = aiohttp.ClientSession(headers=headers, raise_for_status=True)
+        # Keep connections and DNS results around, since every request goes to the same host
+        self._session = aiohttp.ClientSession(headers=headers, raise_for_status=True,
+                                              timeout=aiohttp.ClientTimeout(total=10, connect=3),
+                                              connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300))
         self._url_prefix = "https://www.thebluealliance.com/api/v3/"
 
     async def close(self):
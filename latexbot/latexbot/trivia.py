@@ -7,10 +7,14 @@ import asyncio
 import html
 import pyryver
 import random
+import time
 import typing
+from . import util
 
 
 CUSTOM_TRIVIA_QUESTIONS = {}
+# Custom category names by their lowercase names
+_CUSTOM_CATEGORIES_LOWER = {} # type: typing.Dict[str, str]
 
 
 class OpenTDBError(Exception):
@@ -66,7 +70,7 @@ class TriviaSession:
         url = "https://opentdb.com/api_token.php?command=request"
         async with self._session.get(url) as resp:
             resp.raise_for_status()
-            data = await resp.json()
+            data = await resp.json(loads=util.json_loads)
         if data["response_code"] != OpenTDBError.CODE_SUCCESS:
             raise OpenTDBError(f"Bad response code: {data['response_code']}", data["response_code"])
         return data["token"]
@@ -80,7 +84,7 @@ class TriviaSession:
         url = f"https://opentdb.com/api_token.php?command=reset&token={self._token}"
         async with self._session.get(url) as resp:
             resp.raise_for_status()
-            data = await resp.json()
+            data = await resp.json(loads=util.json_loads)
         if data["response_code"] != OpenTDBError.CODE_SUCCESS:
             raise OpenTDBError(f"Bad response code: {data['response_code']}", data["response_code"])
 
@@ -91,7 +95,7 @@ class TriviaSession:
         url = "https://opentdb.com/api_category.php"
         async with self._session.get(url) as resp:
             resp.raise_for_status()
-            data = await resp.json()
+            data = await resp.json(loads=util.json_loads)
         return data["trivia_categories"]
 
     DIFFICULTY_EASY = "easy"
@@ -116,7 +120,7 @@ class TriviaSession:
             url += f"&token={self._token}"
         async with self._session.get(url) as resp:
             resp.raise_for_status()
-            data = await resp.json()
+            data = await resp.json(loads=util.json_loads)
         if data["response_code"] != OpenTDBError.CODE_SUCCESS:
             raise OpenTDBError(f"Bad response code: {data['response_code']}", data["response_code"])
         # Unescape
@@ -311,17 +315,29 @@ class TriviaGame:
             return False
 
 
+# How long the categories are cached for (in seconds); they almost never change
+_CATEGORIES_CACHE_TTL = 60 * 60
+_categories_cache = None # type: typing.List[typing.Dict[str, typing.Any]]
+_categories_expiry = 0.0
+
+
 async def get_categories() -> typing.List[typing.Dict[str, typing.Any]]:
     """
     Get all the categories and their IDs.
 
     Used to get categories without a game or session object.
+    The result is cached for an hour and should not be modified.
     """
+    global _categories_cache, _categories_expiry # pylint: disable=global-statement
+    if _categories_cache is not None and time.monotonic() < _categories_expiry:
+        return _categories_cache
     url = "https://opentdb.com/api_category.php"
     async with aiohttp.request("GET", url) as resp:
         resp.raise_for_status()
-        data = await resp.json()
-    return data["trivia_categories"]
+        data = await resp.json(loads=util.json_loads)
+    _categories_cache = data["trivia_categories"]
+    _categories_expiry = time.monotonic() + _CATEGORIES_CACHE_TTL
+    return _categories_cache
 
 
 def get_custom_categories() -> typing.List[str]:
@@ -331,12 +347,39 @@ def get_custom_categories() -> typing.List[str]:
     return list(CUSTOM_TRIVIA_QUESTIONS.keys())
 
 
+def find_custom_category(name: str) -> typing.Optional[str]:
+    """
+    Find a custom trivia question category by name (case-insensitive).
+
+    Returns None if the category does not exist.
+    """
+    return _CUSTOM_CATEGORIES_LOWER.get(name.lower())
+
+
+# The categories list last passed to get_category_ids() and the index built from it
+_category_ids_cache = (None, {}) # type: typing.Tuple[typing.List[typing.Dict[str, typing.Any]], typing.Dict[str, int]]
+
+
+def get_category_ids(categories: typing.List[typing.Dict[str, typing.Any]]) -> typing.Dict[str, int]:
+    """
+    Get a dict of category IDs by lowercase name, for a list of categories from get_categories().
+
+    The dict is reused as long as the same list object is passed in.
+    """
+    global _category_ids_cache # pylint: disable=global-statement
+    if _category_ids_cache[0] is not categories:
+        _category_ids_cache = (categories, {c["name"].lower(): c["id"] for c in categories})
+    return _category_ids_cache[1]
+
+
 def set_custom_trivia_questions(questions):
     """
     Set the custom trivia questions.
     """
-    global CUSTOM_TRIVIA_QUESTIONS # pylint: disable=global-statement
+    global CUSTOM_TRIVIA_QUESTIONS, _CUSTOM_CATEGORIES_LOWER # pylint: disable=global-statement
     CUSTOM_TRIVIA_QUESTIONS = questions
+    # Reversed so that the first of several names differing only in case wins
+    _CUSTOM_CATEGORIES_LOWER = {c.lower(): c for c in reversed(list(questions))}
 
 
 _T = typing.TypeVar("_T")
@@ -369,6 +412,8 @@ class LatexBotTriviaGame:
     """
 
     TRIVIA_NUMBER_EMOJIS = ["one", "two", "three", "four", "five", "six", "seven", "eight"]
+    # Answer numbers by emoji
+    TRIVIA_NUMBER_EMOJI_INDEX = {emoji: i for i, emoji in enumerate(TRIVIA_NUMBER_EMOJIS)}
 
     TRIVIA_POINTS = {
         TriviaSession.DIFFICULTY_EASY: 10,
@@ -384,13 +429,17 @@ class LatexBotTriviaGame:
         OpenTDBError.CODE_SUCCESS: "This should never happen.",
     }
 
-    def __init__(self, chat: pyryver.Chat, game: TriviaGame, msg_creator: pyryver.Creator):
+    def __init__(self, chat: pyryver.Chat, game: TriviaGame, msg_creator: pyryver.Creator,
+                 question_msgs: typing.Dict[str, "LatexBotTriviaGame"] = None):
         self.game = game
         self.chat = chat
         self.msg_creator = msg_creator
         self.lock = asyncio.Lock()
         self.timeout_task_handle = None # type: asyncio.Future
         self.question_msg = None # type: pyryver.ChatMessage
+        # An index of games by question message ID that may be shared between games
+        # This game's current question is kept in it until the game ends
+        self.question_msgs = question_msgs if question_msgs is not None else {}
         self.ended = False
 
         self.refresh_timeout()
@@ -463,7 +512,7 @@ class LatexBotTriviaGame:
                 await msg.react("fast_forward")
                 # Now edit the message to show the actual question contents
                 await msg.edit(formatted_question)
-                self.question_msg = msg
+                self._set_question_msg(msg)
         except TimeoutError:
             await self.chat.send_message("Critical: TimeoutError while trying to get message! Ending game!")
             await self.end()
@@ -502,10 +551,21 @@ class LatexBotTriviaGame:
         """
         async with self.lock:
             self.ended = True
+            self._set_question_msg(None)
             if self.timeout_task_handle is not None:
                 self.timeout_task_handle.cancel()
             await self.game.end()
 
+    def _set_question_msg(self, msg: typing.Optional[pyryver.ChatMessage]):
+        """
+        Set the current question message and update the index of games by question message.
+        """
+        if self.question_msg is not None:
+            self.question_msgs.pop(self.question_msg.get_id(), None)
+        self.question_msg = msg
+        if msg is not None:
+            self.question_msgs[msg.get_id()] = self
+
     def get_user_name(self, user_id: int) -> str:
         """
         Get the name of a user specified by ID.
@@ -5,13 +5,23 @@ Utility functions and constants.
 import aiohttp
 import asyncio
 import datetime
+import functools
+import io
 import json
 import marshmallow
+import os
 import pyryver
 import re
+import shlex
 import string
 import typing
 
+# orjson is optional; it is used for faster JSON handling if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 DATE_FORMAT = "%Y-%m-%d %H:%M"
 CALENDAR_DATE_FORMAT = "%Y-%m-%d"
@@ -33,30 +43,47 @@ ALL_TIME_FORMATS = [
 XKCD_PROFILE = "https://www.explainxkcd.com/wiki/images/6/6d/BlackHat_head.png"
 
 MACRO_CHARS = set(string.ascii_lowercase + string.digits + "_")
+# Translation table that deletes all valid macro characters, leaving only the invalid ones
+INVALID_MACRO_CHARS_TRANS = str.maketrans("", "", "".join(MACRO_CHARS))
 
 MENTION_REGEX = re.compile(r"((?:^|[^a-zA-Z0-9_!@#$%&*\\])(?:(?:@)(?!\/)))([a-zA-Z0-9_]*)(?:\b(?!@)|$)", flags=re.MULTILINE)
 MACRO_REGEX = re.compile(r"(^|[^a-z0-9_\\])\.([a-z0-9_]+)\b", flags=re.MULTILINE)
 CHAT_LOOKUP_REGEX = re.compile(r"([a-z]+)=(.*)")
+SHLEX_WHITESPACE_REGEX = re.compile(r"[ \t\r\n]+")
+
+# Strings longer than this are processed in a worker thread by offload_if_large()
+OFFLOAD_THRESHOLD = 4096
 
 
-async def get_msgs_before(chat: pyryver.Chat, msg_id: str, count: int) -> typing.List[pyryver.ChatMessage]:
+async def get_msgs_before(chat: pyryver.Chat, msg_id: str, count: int, skip: int = 0) -> typing.List[pyryver.ChatMessage]:
     """
     Get any number of messages before a message from an ID.
 
     This is similar to using pyryver.Chat.get_message(), except it doesn't have the 25 message restriction.
 
+    If skip is specified, that many messages immediately before the message are skipped first.
+    They still have to be fetched to get to the older messages, but they are not kept.
+    Fewer messages are returned if the start of the chat is reached.
+
     Note that the oldest message is first!
     """
-    msgs = []
+    # Batches of messages, newest first
+    batches = []
+    fetched = 0
+    total = skip + count
     # Get around the 25 message restriction
-    # Cut off the last one (that one is the message with the id specified)
-    msgs = (await pyryver.retry_until_available(chat.get_messages_surrounding, msg_id, before=min(25, count), timeout=5.0))[:-1]
-    count -= len(msgs)
-    while count > 0:
-        prev_msgs = (await pyryver.retry_until_available(chat.get_messages_surrounding, msgs[0].get_id(), before=min(25, count), timeout=5.0))[:-1]
-        msgs = prev_msgs + msgs
-        count -= len(prev_msgs)
-    return msgs
+    while fetched < total:
+        # Cut off the last one (that one is the message with the id specified)
+        batch = (await pyryver.retry_until_available(chat.get_messages_surrounding, msg_id, before=min(25, total - fetched), timeout=5.0))[:-1]
+        if not batch:
+            break
+        msg_id = batch[0].get_id()
+        # Drop the newer messages in the batch that are still being skipped
+        drop = min(max(skip - fetched, 0), len(batch))
+        fetched += len(batch)
+        if drop < len(batch):
+            batches.append(batch[:len(batch) - drop])
+    return [msg for batch in reversed(batches) for msg in batch]
 
 
 def parse_chat_name(ryver: pyryver.Ryver, name: str) -> pyryver.Chat:
@@ -106,9 +133,24 @@ def sanitize(msg: str) -> str:
 
     Currently, this method makes all mentions ineffective by putting a space between the @ and the username.
     """
+    # Most messages have no mentions; the substring check is much cheaper than running the regex
+    if "@" not in msg:
+        return msg
     return MENTION_REGEX.sub(r"\1 \2", msg)
 
 
+async def offload_if_large(func: typing.Callable[[str], str], s: str) -> str:
+    """
+    Call a CPU-bound string processing function such as sanitize() or markdownify().
+
+    If the string is longer than OFFLOAD_THRESHOLD, the function is run in the default
+    executor so it doesn't block the event loop. Otherwise it is called directly.
+    """
+    if len(s) > OFFLOAD_THRESHOLD:
+        return await asyncio.get_event_loop().run_in_executor(None, func, s)
+    return func(s)
+
+
 def caldays_diff(a: datetime.datetime, b: datetime.datetime) -> int:
     """
     Calculate the difference in calendar days between a and b (a - b).
@@ -123,6 +165,20 @@ def caldays_diff(a: datetime.datetime, b: datetime.datetime) -> int:
 _T = typing.TypeVar("_T")
 
 
+def fast_shlex_split(s: str) -> typing.List[str]:
+    """
+    Split a string like shlex.split().
+
+    If the string doesn't contain any quotes or backslashes, splitting on shlex's whitespace
+    characters gives the same result much faster, so that is done instead.
+
+    Raises ValueError on invalid syntax, like shlex.split().
+    """
+    if "\"" not in s and "'" not in s and "\\" not in s:
+        return [token for token in SHLEX_WHITESPACE_REGEX.split(s) if token]
+    return shlex.split(s)
+
+
 def split_list(l: typing.List[_T], v: _T) -> typing.List[typing.List[_T]]:
     """
     Split a list into smaller lists by value.
@@ -137,18 +193,70 @@ def split_list(l: typing.List[_T], v: _T) -> typing.List[typing.List[_T]]:
     return result
 
 
+# Regexes for the strptime directives used in ALL_DATE_FORMATS and ALL_TIME_FORMATS
+# These are looser than strptime's own, since they're only used to skip formats that can't match
+_STRPTIME_DIRECTIVE_REGEXES = {
+    "Y": r"\d{4}",
+    "m": r"\d{1,2}",
+    "d": r" ?\d{1,2}",
+    "b": r"[^\W\d_]+",
+    "H": r"\d{1,2}",
+    "I": r"\d{1,2}",
+    "M": r"\d{1,2}",
+    "p": r"[^\W\d_]+",
+}
+_STRPTIME_TOKEN_REGEX = re.compile(r"%(.)|(\s+)|([^%\s]+)")
+
+
+def _format_to_regex(fmt: str) -> str:
+    """
+    Convert a strptime format into a regex matching (at least) every string it can parse.
+    """
+    regex = ""
+    for directive, space, literal in _STRPTIME_TOKEN_REGEX.findall(fmt):
+        if directive:
+            regex += "(?:" + _STRPTIME_DIRECTIVE_REGEXES[directive] + ")"
+        elif space:
+            # strptime lets any whitespace in the format match any amount of whitespace
+            regex += r"\s+"
+        else:
+            regex += re.escape(literal)
+    return regex
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_format_dispatch(formats: typing.Tuple[str]) -> typing.Pattern:
+    """
+    Compile a regex with a named group for each format, so that one match picks the format to use.
+
+    The formats should not overlap, since only the first one that matches will be tried.
+    """
+    return re.compile("|".join(f"(?P<f{i}>{_format_to_regex(fmt)})" for i, fmt in enumerate(formats)), re.IGNORECASE)
+
+
+# Compile the dispatch regexes for the known formats up front
+_DATE_DISPATCH = _compile_format_dispatch(tuple(ALL_DATE_FORMATS))
+_TIME_DISPATCH = _compile_format_dispatch(tuple(ALL_TIME_FORMATS))
+
+
+@functools.lru_cache(maxsize=256)
+def _tryparse_datetime(s: str, formats: typing.Tuple[str]) -> datetime:
+    match = _compile_format_dispatch(formats).fullmatch(s)
+    if match is None:
+        return None
+    try:
+        return datetime.datetime.strptime(s, formats[int(match.lastgroup[1:])])
+    except ValueError:
+        return None
+
+
 def tryparse_datetime(s: str, formats: typing.List[str]) -> datetime:
     """
     Tries to parse the given string with any of the formats listed.
 
     If all formats fail, returns None.
     """
-    for fmt in formats:
-        try:
-            return datetime.datetime.strptime(s, fmt)
-        except ValueError:
-            pass
-    return None
+    return _tryparse_datetime(s, tuple(formats))
 
 
 def format_access_rules(ryver: pyryver.Ryver, command: str, rule) -> str:
@@ -169,6 +277,66 @@ def format_access_rules(ryver: pyryver.Ryver, command: str, rule) -> str:
     return result
 
 
+def json_dumps(data: typing.Any) -> str:
+    """
+    Serialize data into a compact JSON string.
+
+    orjson is used if it is installed and can serialize the data, otherwise the json module is used.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data)
+
+
+def json_dumps_pretty(data: typing.Any) -> str:
+    """
+    Serialize data into a JSON string indented by 2 spaces.
+
+    orjson is used if it is installed and can serialize the data, otherwise the json module is used.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except TypeError:
+            # e.g. dict subclasses like CaseInsensitiveDict, whose keys aren't strs internally
+            pass
+    return json.dumps(data, indent=2)
+
+
+def json_loads(data: typing.Union[str, bytes]) -> typing.Any:
+    """
+    Deserialize a JSON string.
+
+    orjson is used if it is installed. Either way, a json.JSONDecodeError is raised for invalid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_file_atomic(path: str, data: str) -> None:
+    """
+    Write a file by writing to a temporary file and then renaming it over the original.
+
+    This way the file is never left partially written if LaTeX Bot is stopped while saving.
+    """
+    tmp = path + ".tmp"
+    try:
+        # Always UTF-8, since orjson doesn't escape non-ASCII characters
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
 async def send_json_data(chat: pyryver.Chat, data: typing.Any, message: str, filename: str, from_user: pyryver.User, msg_creator: pyryver.Creator):
     """
     Send a JSON to the chat.
@@ -176,7 +344,7 @@ async def send_json_data(chat: pyryver.Chat, data: typing.Any, message: str, fil
     If the JSON is less than 3900 characters, it will be sent as text.
     Otherwise it will be attached as a file.
     """
-    json_data = json.dumps(data, indent=2)
+    json_data = json_dumps_pretty(data)
     if len(json_data) < 3900:
         await chat.send_message(f"```json\n{json_data}\n```", msg_creator)
     else:
@@ -206,7 +374,7 @@ async def get_attached_json_data(msg: pyryver.ChatMessage, msg_contents: str) ->
         data = msg_contents
 
     try:
-        return json.loads(data)
+        return json_loads(data)
     except json.JSONDecodeError as e:
         raise ValueError(f"Error decoding JSON: {e}") from e
 
@@ -269,19 +437,26 @@ def paginate(text: typing.Iterable[str], title: str = "", header: str = "", sep:
     content.
     """
     pages = []
-    page = None
+    # Collect the rows of the current page and only join them once the page is full
+    # The prefix (title and/or header) is not followed by a separator
+    prefix = None
+    rows = []
+    length = 0
     for row in text:
-        if page is None:
-            page = title + header
-            new_page = page + row
+        if prefix is None:
+            prefix = title + header
+            new_length = len(prefix) + len(row)
         else:
-            new_page = page + sep + row
-        if len(new_page) < limit:
-            page = new_page
+            new_length = length + len(sep) + len(row)
+        if new_length < limit:
+            rows.append(row)
+            length = new_length
         else:
-            pages.append(page)
-            page = header + row
-    pages.append(page)
+            pages.append(prefix + sep.join(rows))
+            prefix = header
+            rows = [row]
+            length = len(header) + len(row)
+    pages.append(prefix + sep.join(rows) if prefix is not None else None)
     for i, page in enumerate(pages):
         if len(pages) == 1:
             yield page
@@ -311,13 +486,16 @@ def contains_ignorecase(s: str, i: typing.Iterable[str]) -> bool:
 async def process_concurrent(objs: typing.List[typing.Any], process: typing.Callable[[typing.Any], typing.Awaitable], workers: int = 5):
     """
     Run a processing coroutine on a list of objects with multiple concurrent workers.
+
+    Each worker takes the next unprocessed object as soon as it is done with its current
+    one, so a few slow objects don't hold up a whole share of the list.
     """
-    # Divide and round up
-    step = (len(objs) - 1) // workers + 1
-    async def _proc_range(start, end):
-        for i in range(start, end):
-            await process(objs[i])
-    return asyncio.gather(*(_proc_range(i * step, min((i + 1) * step, len(objs))) for i in range(workers)))
+    # Shared between the workers; this is safe since they all run in the same thread
+    it = iter(objs)
+    async def _worker():
+        for obj in it:
+            await process(obj)
+    await asyncio.gather(*(_worker() for _ in range(min(workers, len(objs)))))
 
 
 def format_validation_error(e: marshmallow.ValidationError) -> str:
@@ -325,3 +503,26 @@ def format_validation_error(e: marshmallow.ValidationError) -> str:
     Format a marshmallow ValidationError into a nice markdown string.
     """
     return "\n".join(f"* {k}\n" + "\n".join(f"  * {m}" for m in v) for k, v in e.messages.items())
+
+
+class BoundedStringIO(io.StringIO):
+    """
+    A StringIO that drops anything written past a maximum length.
+
+    If anything was dropped, the truncated attribute will be set to True.
+    """
+
+    def __init__(self, max_len: int):
+        super().__init__()
+        self.max_len = max_len
+        self.truncated = False
+
+    def write(self, s: str) -> int:
+        remaining = self.max_len - self.tell()
+        if len(s) > remaining:
+            self.truncated = True
+            super().write(s[:max(remaining, 0)])
+        else:
+            super().write(s)
+        # Pretend everything was written so callers don't retry
+        return len(s)
@@ -1,5 +1,6 @@
 import aiohttp
 from typing import Union, Dict, Any
+from . import util
 
 async def get_comic(number: int = None, session: aiohttp.ClientSession = None) -> Union[Dict[str, Any], None]:
     """
@@ -33,7 +34,7 @@ async def get_comic(number: int = None, session: aiohttp.ClientSession = None) -
         if resp.status == 404:
             return None
         resp.raise_for_status()
-        return await resp.json()
+        return await resp.json(loads=util.json_loads)
 
 
 def comic_to_str(comic: Dict[str, Any]) -> str:
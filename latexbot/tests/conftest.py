@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# latexbot reads its data directory from the environment on import
+os.environ.setdefault("LATEXBOT_DATA_DIR", tempfile.mkdtemp())
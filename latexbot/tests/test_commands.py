@@ -0,0 +1,12 @@
+from latexbot import commands
+
+
+def test_parse_range():
+    assert commands._parse_range("5") == (1, 5)
+    assert commands._parse_range(" 2 - 5 ") == (2, 5)
+    assert commands._parse_range("3-3") == (3, 3)
+
+
+def test_parse_range_invalid():
+    for s in ("0-5", "5-2", "0", "", "a-5", "-5", "1-2-3"):
+        assert commands._parse_range(s) is None
@@ -0,0 +1,11 @@
+from latexbot import schemas
+
+
+def test_aliases_keep_first_duplicate():
+    aliases = schemas.AliasesField().deserialize([
+        {"from": "a", "to": "first"},
+        {"from": "b", "to": "other"},
+        {"from": "a", "to": "second"},
+    ])
+    assert aliases == {"a": "first", "b": "other"}
+    assert list(aliases) == ["a", "b"]
@@ -0,0 +1,18 @@
+import datetime
+from latexbot import util
+
+
+def test_tryparse_datetime_dates():
+    expected = datetime.datetime(2020, 1, 2)
+    for s in ("2020-01-02", "2020/1/2", "Jan 02 2020", "jan 2, 2020"):
+        assert util.tryparse_datetime(s, util.ALL_DATE_FORMATS) == expected
+    for s in ("2020-13-01", "Feb 30 2020", "2020-01-02 ", "Jan 2 2020, ", ""):
+        assert util.tryparse_datetime(s, util.ALL_DATE_FORMATS) is None
+
+
+def test_tryparse_datetime_times():
+    assert util.tryparse_datetime("13:05", util.ALL_TIME_FORMATS).time() == datetime.time(13, 5)
+    assert util.tryparse_datetime("1:05 PM", util.ALL_TIME_FORMATS).time() == datetime.time(13, 5)
+    assert util.tryparse_datetime("12:00am", util.ALL_TIME_FORMATS).time() == datetime.time(0, 0)
+    for s in ("24:00", "13:00 PM", "12:00 XM", "12"):
+        assert util.tryparse_datetime(s, util.ALL_TIME_FORMATS) is None